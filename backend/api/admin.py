@@ -1,3 +1,38 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import path
 
-# Register your models here.
+from api.profiling import list_profiles, profile_path, profile_stats
+
+
+def profiles_view(request):
+    """Список сохранённых профилей запросов."""
+    return TemplateResponse(request, 'admin/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'profiles': list_profiles(),
+    })
+
+
+def profile_view(request, name):
+    """Файл профиля или сводка pstats для .prof (?stats=1)."""
+    path = profile_path(name)
+    if path is None:
+        raise Http404
+    if request.GET.get('stats') and path.suffix == '.prof':
+        return TemplateResponse(request, 'admin/profile_stats.html', {
+            **admin.site.each_context(request),
+            'title': name,
+            'stats': profile_stats(path),
+        })
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+
+# Подключаются в backend/urls.py перед admin.site.urls.
+urlpatterns = [
+    path('profiles/', admin.site.admin_view(profiles_view),
+         name='admin-profiles'),
+    path('profiles/<str:name>', admin.site.admin_view(profile_view),
+         name='admin-profile'),
+]
@@ -0,0 +1,152 @@
+"""Аутентификация по токену с кешем проверенных токенов.
+
+TokenAuthentication из DRF на каждый запрос выбирает токен вместе с
+пользователем. CachedTokenAuthentication запоминает результат проверки:
+сначала в памяти процесса (LRU на TOKEN_CACHE_SIZE записей, каждая живёт
+TOKEN_CACHE_TTL секунд), затем, если задан TOKEN_CACHE_ALIAS, в общем для
+воркеров кеше Django на TOKEN_CACHE_SHARED_TTL секунд. Ключ — SHA-256
+токена, сам токен в ключах кеша не хранится. Запросы получают копии
+пользователя и токена, изменения одного запроса другим не видны.
+
+Пароль и счётчики (поля editable=False) в копии пользователя отложены:
+они читаются из базы при обращении, а save() их не записывает, поэтому
+сохранение профиля из закешированного пользователя не вернёт прежний
+пароль или устаревшие счётчики.
+
+Записи удаляются сигналами (api.signals) при удалении токена (выход
+через djoser token/logout, удаление пользователя) и при сохранении
+пользователя (смена пароля, деактивация) — сразу и после фиксации
+транзакции. Сброс в памяти действует только в своём процессе: другие
+воркеры могут принимать отозванный токен ещё до TOKEN_CACHE_TTL секунд,
+поэтому это время небольшое.
+
+Попадания и промахи уровней видны в метриках как кеши auth_tokens_local
+и auth_tokens_shared.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api.metrics import record_cache
+
+
+def token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def shared_key(digest):
+    return f'token:{digest}'
+
+
+def detached_user(user):
+    """Копия пользователя без пароля и счётчиков (они отложены)."""
+    user = copy.copy(user)
+    for field in user._meta.concrete_fields:
+        if field.name == 'password' or not field.editable:
+            user.__dict__.pop(field.attname, None)
+    return user
+
+
+class TokenCache:
+    """LRU-кеш проверенных токенов в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return token
+
+    def set(self, digest, token):
+        with self.lock:
+            self.entries[digest] = (
+                token, time.monotonic() + settings.TOKEN_CACHE_TTL
+            )
+            self.entries.move_to_end(digest)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, digests):
+        with self.lock:
+            for digest in digests:
+                self.entries.pop(digest, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def get_shared_cache():
+    if settings.TOKEN_CACHE_ALIAS:
+        return caches[settings.TOKEN_CACHE_ALIAS]
+    return None
+
+
+def delete_tokens(digests):
+    token_cache.delete(digests)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete_many([shared_key(digest) for digest in digests])
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кешей сразу и после фиксации транзакции."""
+    digests = [token_digest(key) for key in keys]
+    if not digests:
+        return
+    delete_tokens(digests)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(delete_tokens, digests))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем проверенных токенов."""
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_ENABLED:
+            return super().authenticate_credentials(key)
+        digest = token_digest(key)
+        token = token_cache.get(digest)
+        record_cache('auth_tokens_local', token is not None)
+        if token is None:
+            token = self.get_shared(digest)
+        if token is None:
+            token = super().authenticate_credentials(key)[1]
+            shared = get_shared_cache()
+            if shared is not None:
+                shared.set(shared_key(digest), token,
+                           settings.TOKEN_CACHE_SHARED_TTL)
+            token_cache.set(digest, token)
+        token = copy.copy(token)
+        token.user = detached_user(token.user)
+        return token.user, token
+
+    def get_shared(self, digest):
+        shared = get_shared_cache()
+        if shared is None:
+            return None
+        token = shared.get(shared_key(digest))
+        record_cache('auth_tokens_shared', token is not None)
+        if token is not None:
+            token_cache.set(digest, token)
+        return token
@@ -0,0 +1,208 @@
+"""Готовый JSON-снимок справочника ингредиентов.
+
+Справочник меняется только через админку или load_data, поэтому полный
+список ингредиентов сериализуется один раз в файл. Снимок версионируется
+хешем содержимого (он же служит строгим ETag) и сохраняется вместе со
+сжатыми копиями .gz и .br в INGREDIENT_CATALOG_DIR:
+
+* ingredients.<версия>.json[.gz|.br] — неизменяемые версии;
+* ingredients.json[.gz|.br] — текущая версия, её может отдавать nginx.
+
+Brotli используется, только если установлен пакет brotli.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+from api.db_router import read_primary
+from api.metrics import record_cache
+from core.models import Ingredient
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+CURRENT_NAME = 'ingredients.json'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+KEEP_VERSIONS = 5
+
+
+class CatalogSnapshot:
+    """Содержимое снимка в памяти процесса."""
+
+    def __init__(self, content, encoded=None):
+        self.content = content
+        self.version = hashlib.sha256(content).hexdigest()[:16]
+        self.etag = f'"{self.version}"'
+        if encoded is None:
+            encoded = {'gzip': gzip.compress(content, mtime=0)}
+            if brotli is not None:
+                encoded['br'] = brotli.compress(content)
+        self.encoded = encoded
+
+    @classmethod
+    def from_files(cls, directory):
+        encoded = {}
+        for encoding, suffix in ENCODINGS:
+            try:
+                encoded[encoding] = (
+                    directory / f'{CURRENT_NAME}{suffix}'
+                ).read_bytes()
+            except FileNotFoundError:
+                pass
+        return cls((directory / CURRENT_NAME).read_bytes(), encoded)
+
+    @classmethod
+    def from_db(cls):
+        items = Ingredient.objects.order_by('name').values(
+            'id', 'name', 'measurement_unit'
+        )
+        return cls(json.dumps(
+            list(items), ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8'))
+
+    def files(self):
+        """Пары (суффикс, байты) для несжатой и сжатых версий."""
+        yield '', self.content
+        for encoding, suffix in ENCODINGS:
+            if encoding in self.encoded:
+                yield suffix, self.encoded[encoding]
+
+
+def catalog_dir():
+    return Path(settings.INGREDIENT_CATALOG_DIR)
+
+
+def write_atomic(path, content):
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot():
+    """Собирает снимок из базы и записывает файлы версии и текущей копии."""
+    with read_primary():
+        snapshot = CatalogSnapshot.from_db()
+    directory = catalog_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    for suffix, content in snapshot.files():
+        write_atomic(
+            directory / f'ingredients.{snapshot.version}.json{suffix}',
+            content
+        )
+    # Несжатая копия пишется последней: по её изменению процессы узнают
+    # о новой версии.
+    for suffix, content in reversed(list(snapshot.files())):
+        write_atomic(directory / f'{CURRENT_NAME}{suffix}', content)
+    _cache.update(snapshot)
+    prune_versions(directory)
+    return snapshot
+
+
+def prune_versions(directory):
+    """Удаляет старые версии, оставляя KEEP_VERSIONS последних."""
+    versions = sorted(
+        directory.glob('ingredients.*.json'),
+        key=lambda path: path.stat().st_mtime_ns, reverse=True
+    )
+    for path in versions[KEEP_VERSIONS:]:
+        for suffix in ('', *(suffix for _, suffix in ENCODINGS)):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+class SnapshotCache:
+    """Текущий снимок, перечитываемый при изменении файла на диске."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.stat = None
+
+    def update(self, snapshot):
+        with self.lock:
+            self.snapshot = snapshot
+            self.stat = self.current_stat()
+
+    def current_stat(self):
+        try:
+            stat = (catalog_dir() / CURRENT_NAME).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        stat = self.current_stat()
+        if stat is None:
+            record_cache('ingredient_catalog', False)
+            return build_snapshot()
+        hit = True
+        if self.snapshot is None or stat != self.stat:
+            with self.lock:
+                if self.snapshot is None or stat != self.stat:
+                    self.snapshot = CatalogSnapshot.from_files(
+                        catalog_dir()
+                    )
+                    self.stat = stat
+                    hit = False
+        record_cache('ingredient_catalog', hit)
+        return self.snapshot
+
+
+_cache = SnapshotCache()
+
+
+def get_snapshot():
+    """Текущий снимок справочника; при отсутствии файла он собирается."""
+    return _cache.get()
+
+
+def schedule_rebuild():
+    """Пересобирает снимок после фиксации текущей транзакции.
+
+    Несколько изменений в одной транзакции приводят к одной пересборке.
+    """
+    connection = transaction.get_connection()
+    if any(entry[1] is build_snapshot for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(build_snapshot)
+
+
+def snapshot_response(request, snapshot):
+    """Ответ со снимком: строгий ETag, 304 и предсжатое тело."""
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = next(
+        (name for name, _ in ENCODINGS
+         if name in snapshot.encoded and re.search(rf'\b{name}\b', accepted)),
+        None
+    )
+    etag = (f'"{snapshot.version}-{encoding}"' if encoding
+            else snapshot.etag)
+    if_none_match = request.headers.get('If-None-Match', '')
+    tags = {
+        tag.strip().removeprefix('W/').strip('"')
+        for tag in if_none_match.split(',')
+    }
+    if '*' in tags or any(
+        tag.split('-')[0] == snapshot.version for tag in tags
+    ):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            snapshot.encoded[encoding] if encoding else snapshot.content,
+            content_type='application/json'
+        )
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'no-cache'
+    return response
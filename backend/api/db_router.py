@@ -0,0 +1,98 @@
+"""Чтение из реплик базы для безопасных запросов.
+
+ReplicaRouter отправляет все записи в основную базу default, а чтения —
+в базу, выбранную для текущего запроса (ContextVar, по умолчанию
+default). ReplicaReadMixin у RecipeViewSet, IngredientViewSet и
+UserManagementViewSet выбирает для GET, HEAD и OPTIONS случайную
+реплику из DATABASE_REPLICAS; остальные представления и команды всегда
+читают из основной базы.
+
+Реплики отстают от основной базы, поэтому после успешного изменяющего
+запроса (любого, в том числе входа и смены пароля djoser)
+ReplicaPinMiddleware (api.middleware) возвращает cookie pin_primary и
+заголовок X-Pin-Primary со временем окончания привязки. Пока оно не
+наступило (REPLICA_PIN_SECONDS), запросы с этим cookie или заголовком
+читают из основной базы и видят свои изменения.
+
+Кеши ответов и фрагментов рецептов заполняются чтением из основной базы
+(read_primary): иначе отставшая реплика вернула бы в кеш данные, которые
+только что из него удалены.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+PIN_COOKIE = 'pin_primary'
+PIN_HEADER = 'X-Pin-Primary'
+
+read_alias = ContextVar('read_alias', default=PRIMARY)
+
+
+@contextmanager
+def read_from(alias):
+    """Чтения внутри блока идут в базу alias."""
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def read_primary():
+    return read_from(PRIMARY)
+
+
+def pinned(request):
+    """Запрос привязан к основной базе cookie или заголовком."""
+    value = request.COOKIES.get(PIN_COOKIE) or request.headers.get(PIN_HEADER)
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+
+def replica_for(request):
+    """База для чтений запроса: случайная реплика или основная."""
+    if (not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS or pinned(request)):
+        return PRIMARY
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def pin_response(response):
+    """Привязывает клиента к основной базе на REPLICA_PIN_SECONDS."""
+    until = f'{time.time() + settings.REPLICA_PIN_SECONDS:.3f}'
+    response.set_cookie(PIN_COOKIE, until,
+                        max_age=settings.REPLICA_PIN_SECONDS,
+                        httponly=True, samesite='Lax')
+    response[PIN_HEADER] = until
+
+
+class ReplicaRouter:
+    """Записи — в основную базу, чтения — в базу текущего запроса."""
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы к представлению читают из реплики."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_from(replica_for(request)):
+            return super().dispatch(request, *args, **kwargs)
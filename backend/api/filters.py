@@ -3,6 +3,20 @@ from django_filters import rest_framework
 from core.models import ShoppingCart, Favorite, Recipe
 
 
+def favorite_exists(user):
+    """Подзапрос: рецепт находится в избранном у пользователя."""
+    return Exists(
+        Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+    )
+
+
+def in_cart_exists(user):
+    """Подзапрос: рецепт находится в корзине у пользователя."""
+    return Exists(
+        ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+    )
+
+
 class RecipeFilter(rest_framework.FilterSet):
     """Фильтр для рецептов с дополнительными параметрами."""
 
@@ -21,22 +35,12 @@ class RecipeFilter(rest_framework.FilterSet):
         if not self.request.user.is_authenticated:
             return queryset
 
-        favorite_exists = Exists(
-            Favorite.objects.filter(user=self.request.user,
-                                    recipe=OuterRef('pk'))
-        )
-        return queryset.filter(favorite_exists) if value else queryset.exclude(
-            favorite_exists
-        )
+        exists = favorite_exists(self.request.user)
+        return queryset.filter(exists) if value else queryset.exclude(exists)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if not self.request.user.is_authenticated:
             return queryset
 
-        in_cart_exists = Exists(
-            ShoppingCart.objects.filter(user=self.request.user,
-                                        recipe=OuterRef('pk'))
-        )
-        return queryset.filter(in_cart_exists) if value else queryset.exclude(
-            in_cart_exists
-        )
+        exists = in_cart_exists(self.request.user)
+        return queryset.filter(exists) if value else queryset.exclude(exists)
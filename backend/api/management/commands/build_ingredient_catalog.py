@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.catalog import build_snapshot, catalog_dir
+
+
+class Command(BaseCommand):
+    help = "Собирает JSON-снимок справочника ингредиентов"
+
+    def handle(self, *args, **kwargs):
+        snapshot = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {snapshot.version} записан в {catalog_dir()} "
+            f"({len(snapshot.content)} байт, сжатые копии: "
+            f"{', '.join(snapshot.encoded) or 'нет'})."
+        ))
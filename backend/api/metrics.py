@@ -0,0 +1,272 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+MetricsMiddleware (api.middleware) для каждого HTTP-запроса записывает
+в реестр процесса число запросов, гистограммы времени ответа, размера
+ответа и числа SQL-запросов с метками view и action (класс
+представления DRF и его действие, например RecipeViewSet/list). Кеши
+сообщают о попаданиях и промахах через record_cache().
+
+Реестр хранится в памяти процесса. Если задан METRICS_DIR, каждый
+процесс (воркер gunicorn) раз в METRICS_FLUSH_INTERVAL секунд сохраняет
+свои значения в файл metrics_<pid>.json этого каталога, а /metrics
+суммирует файлы работающих воркеров. Файлы завершённых процессов
+удаляются при сборе: после перезапуска воркера его счётчики начинаются
+заново, и Prometheus учитывает это как сброс счётчика в rate() и
+increase(). Без METRICS_DIR /metrics показывает только процесс, который
+обработал запрос.
+
+/metrics отвечает только адресам из METRICS_ALLOWED_IPS или запросам с
+токеном METRICS_TOKEN; nginx этот адрес наружу не проксирует.
+"""
+import atexit
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Имя метрики: тип, описание и границы корзин гистограммы.
+METRICS = {
+    'foodgram_http_requests_total': (
+        'counter', 'Число HTTP-запросов.', None
+    ),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки HTTP-запроса.', DURATION_BUCKETS
+    ),
+    'foodgram_http_response_size_bytes': (
+        'histogram', 'Размер тела ответа.', SIZE_BUCKETS
+    ),
+    'foodgram_http_db_queries': (
+        'histogram', 'Число SQL-запросов на HTTP-запрос.', QUERY_BUCKETS
+    ),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам: попадания и промахи.', None
+    ),
+}
+
+METHODS = frozenset(
+    ('get', 'post', 'put', 'patch', 'delete', 'head', 'options')
+)
+
+
+class Registry:
+    """Значения метрик процесса.
+
+    Ключ — имя метрики и кортеж пар (метка, значение); значение счётчика —
+    число, гистограммы — список [счётчики корзин..., +Inf, сумма].
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.pid = os.getpid()
+        self.dirty = False
+        self.flusher = None
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.check_fork()
+            self.values[key] = self.values.get(key, 0) + amount
+            self.touch()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.check_fork()
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(buckets) + 2)
+            state[bisect_left(buckets, value)] += 1
+            state[-1] += value
+            self.touch()
+
+    def check_fork(self):
+        # После fork (gunicorn --preload) значения мастера не наследуются.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.values = {}
+            self.flusher = None
+
+    def touch(self):
+        self.dirty = True
+        if settings.METRICS_DIR and self.flusher is None:
+            self.flusher = threading.Thread(target=self.flush_loop,
+                                            daemon=True)
+            self.flusher.start()
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [name, list(labels), list(value) if isinstance(value, list)
+                 else value]
+                for (name, labels), value in self.values.items()
+            ]
+
+    def flush_loop(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Сохраняет значения процесса в METRICS_DIR."""
+        if not settings.METRICS_DIR or not self.dirty:
+            return
+        self.dirty = False
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'metrics_{os.getpid()}.json'
+        temporary = path.with_name(path.name + '.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def record_cache(cache, hit, count=1):
+    """Попадания или промахи кеша с именем cache."""
+    if count:
+        registry.inc('foodgram_cache_requests_total',
+                     {'cache': cache, 'result': 'hit' if hit else 'miss'},
+                     count)
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю.
+        return True
+    return True
+
+
+def collect():
+    """Значения всех процессов: файлы METRICS_DIR и текущий процесс."""
+    sources = [registry.snapshot()]
+    if settings.METRICS_DIR:
+        directory = Path(settings.METRICS_DIR)
+        for path in directory.glob('metrics_*.json'):
+            pid = path.stem.removeprefix('metrics_')
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            if not process_exists(int(pid)):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                sources.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    merged = {}
+    for entries in sources:
+        for name, labels, value in entries:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = merged.get(key)
+            if current is None:
+                merged[key] = value
+            elif isinstance(value, list):
+                if len(value) == len(current):
+                    merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = current + value
+    return merged
+
+
+def escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{escape(value)}"' for name, value in labels
+    ) + '}'
+
+
+def format_number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(values):
+    """Текстовый формат Prometheus (exposition format 0.0.4)."""
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        series = sorted(
+            (labels, value) for (metric, labels), value in values.items()
+            if metric == name
+        )
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(
+                    f'{name}{format_labels(labels)} {format_number(value)}'
+                )
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_number(bound)
+                lines.append(
+                    f'{name}_bucket{format_labels((*labels, ("le", le)))} '
+                    f'{cumulative}'
+                )
+            lines.append(
+                f'{name}_sum{format_labels(labels)} '
+                f'{format_number(value[-1])}'
+            )
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def allowed(request):
+    """Запрос с разрешённого адреса или с токеном METRICS_TOKEN."""
+    if settings.METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {settings.METRICS_TOKEN}'.encode()
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+def metrics_view(request):
+    """Метрики всех воркеров для Prometheus."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not allowed(request):
+        raise PermissionDenied
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,352 @@
+"""Замер SQL-запросов и времени обработки запроса.
+
+Профилирование запросов по требованию — RequestProfilerMiddleware, см.
+api.profiling; метрики Prometheus — MetricsMiddleware, см. api.metrics;
+привязка к основной базе после записи — ReplicaPinMiddleware, см.
+api.db_router.
+
+RequestTimingMiddleware оборачивает выполнение запросов ко всем базам
+(connection.execute_wrapper) и для каждого замеряемого HTTP-запроса
+считает число SQL-запросов, время в БД, повторы запросов одинаковой
+формы и время представления без учёта БД (в основном сериализация) и
+рендеринга ответа. Итог отдаётся в заголовке Server-Timing и пишется
+JSON-строкой в журнал api.timing; для медленных запросов в журнал
+попадают самые долгие SQL-запросы и самые частые повторы.
+
+Настройки (см. settings.py): REQUEST_TIMING_SAMPLE_RATE — доля
+замеряемых запросов (0 отключает замер), REQUEST_TIMING_SLOW_MS — порог
+медленного запроса, REQUEST_TIMING_TOP_QUERIES — сколько запросов
+выводить, REQUEST_TIMING_DETAILED — собирать ли тексты и формы запросов
+(без них остаются только счётчики и время), REQUEST_TIMING_HEADER —
+добавлять ли Server-Timing.
+
+SQL-запросы потокового ответа (выгрузка списка покупок) выполняются
+уже после выхода из middleware, при чтении его содержимого. Их тоже
+считает wrap_queries, поэтому для такого ответа журнал пишется после
+отдачи с полем streamed, а Server-Timing, отправленный до начала потока,
+содержит только запросы представления.
+"""
+import heapq
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from api.db_router import pin_response
+from api.metrics import METHODS, registry
+from api.profiling import profiling_allowed, requested_mode, run_profiled
+
+logger = logging.getLogger('api.timing')
+
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """Форма запроса: списки параметров и числа заменены заглушками."""
+    return NUMBER.sub('?', PLACEHOLDER_LIST.sub('(...)', sql))
+
+
+class RequestStats:
+    """Счётчики одного HTTP-запроса; вызывается как execute_wrapper."""
+
+    def __init__(self, detailed, top):
+        self.detailed = detailed
+        self.top = top
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.slowest = []
+        self.view_started = None
+        self.view_db_time = 0.0
+        self.view_time = None
+        self.render_started = None
+        self.render_time = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.detailed:
+                self.fingerprints[fingerprint(sql)] += 1
+                item = (elapsed, self.queries, sql)
+                if len(self.slowest) < self.top:
+                    heapq.heappush(self.slowest, item)
+                else:
+                    heapq.heappushpop(self.slowest, item)
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def start_view(self):
+        self.view_started = time.perf_counter()
+        self.view_db_time = self.db_time
+
+    def finish_view(self):
+        if self.view_started is not None and self.view_time is None:
+            self.view_time = time.perf_counter() - self.view_started
+            self.view_db_time = self.db_time - self.view_db_time
+
+    def start_render(self):
+        self.finish_view()
+        self.render_started = time.perf_counter()
+
+    def finish_render(self, response):
+        self.render_time = time.perf_counter() - self.render_started
+
+    @property
+    def app_time(self):
+        """Время представления за вычетом запросов к БД."""
+        if self.view_time is None:
+            return None
+        return max(self.view_time - self.view_db_time, 0.0)
+
+
+def wrap_queries(content, wrapper):
+    """Отдаёт content, пропуская запросы к базам при его чтении через wrapper.
+
+    Обёртка ставится на время получения каждой части, а не на всё время
+    жизни генератора: между частями соединения используются без неё.
+    """
+    content = iter(content)
+    while True:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            try:
+                chunk = next(content)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestTimingMiddleware:
+    """Server-Timing и журнал с SQL-статистикой для доли запросов."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        self.slow = settings.REQUEST_TIMING_SLOW_MS / 1000
+        self.top = settings.REQUEST_TIMING_TOP_QUERIES
+        self.detailed = settings.REQUEST_TIMING_DETAILED
+        self.header = settings.REQUEST_TIMING_HEADER
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or (
+            self.sample_rate < 1 and random.random() >= self.sample_rate
+        ):
+            return self.get_response(request)
+        stats = request.timing_stats = RequestStats(self.detailed, self.top)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        stats.finish_view()
+        total = time.perf_counter() - started
+        if self.header:
+            response['Server-Timing'] = self.server_timing(stats, total)
+        if response.streaming:
+            response.streaming_content = self.log_after_stream(
+                request, response, response.streaming_content, stats, started
+            )
+        else:
+            self.log(request, response, stats, total)
+        return response
+
+    def log_after_stream(self, request, response, content, stats, started):
+        try:
+            yield from wrap_queries(content, stats)
+        finally:
+            self.log(request, response, stats,
+                     time.perf_counter() - started, streamed=True)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, 'timing_stats', None)
+        if stats is not None:
+            stats.start_view()
+
+    def process_template_response(self, request, response):
+        # Вызывается после представления и перед рендерингом ответа DRF.
+        stats = getattr(request, 'timing_stats', None)
+        if stats is not None:
+            stats.start_render()
+            response.add_post_render_callback(stats.finish_render)
+        return response
+
+    @staticmethod
+    def server_timing(stats, total):
+        description = f'queries={stats.queries}'
+        if stats.detailed:
+            description += f' duplicates={stats.duplicates}'
+        metrics = [f'db;dur={ms(stats.db_time)};desc="{description}"']
+        if stats.app_time is not None:
+            metrics.append(f'app;dur={ms(stats.app_time)}')
+        if stats.render_time is not None:
+            metrics.append(f'render;dur={ms(stats.render_time)}')
+        metrics.append(f'total;dur={ms(total)}')
+        return ', '.join(metrics)
+
+    def log(self, request, response, stats, total, streamed=False):
+        slow = total >= self.slow
+        level = logging.WARNING if slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': ms(total),
+            'db_ms': ms(stats.db_time),
+            'queries': stats.queries,
+            'app_ms': (ms(stats.app_time) if stats.app_time is not None
+                       else None),
+            'render_ms': (ms(stats.render_time)
+                          if stats.render_time is not None else None),
+        }
+        if streamed:
+            record['streamed'] = True
+        if stats.detailed:
+            record['duplicates'] = stats.duplicates
+        if slow and stats.detailed:
+            record['slow_queries'] = [
+                {'ms': ms(elapsed), 'sql': sql}
+                for elapsed, _, sql in sorted(stats.slowest, reverse=True)
+            ]
+            record['repeated_queries'] = [
+                {'count': count, 'sql': sql}
+                for sql, count in stats.fingerprints.most_common(self.top)
+                if count > 1
+            ]
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+
+
+class RequestProfilerMiddleware:
+    """Профилирование запроса по требованию сотрудника (api.profiling)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(settings.PROFILING_USERS)
+
+    def __call__(self, request):
+        if self.enabled:
+            mode = requested_mode(request)
+            if mode is not None and profiling_allowed(request):
+                return run_profiled(request, self.get_response, mode)
+        return self.get_response(request)
+
+
+class ReplicaPinMiddleware:
+    """Чтения клиента из основной базы после его записи (api.db_router)."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            pin_response(response)
+        return response
+
+
+def view_labels(view_func, method):
+    """Метки view и action для вызываемого представления."""
+    method = method.lower() if method.lower() in METHODS else 'other'
+    cls = getattr(view_func, 'cls', None)
+    if cls is not None:
+        actions = getattr(view_func, 'actions', None) or {}
+        return cls.__name__, actions.get(method, method)
+    name = getattr(view_func, '__qualname__', type(view_func).__name__)
+    return f'{view_func.__module__}.{name}', method
+
+
+class QueryCounter:
+    """Считает SQL-запросы; вызывается как execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Записывает метрики каждого HTTP-запроса в реестр процесса."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        view, action = getattr(
+            request, 'metrics_labels', ('unresolved', 'other')
+        )
+        labels = {'view': view, 'action': action}
+        registry.inc('foodgram_http_requests_total', {
+            **labels, 'status': str(response.status_code)
+        })
+        registry.observe('foodgram_http_request_duration_seconds', labels,
+                         elapsed)
+        if response.streaming:
+            # Размер и запросы потокового ответа известны только после
+            # отдачи.
+            response.streaming_content = self.observe_stream(
+                response.streaming_content, labels, counter
+            )
+            return response
+        registry.observe('foodgram_http_db_queries', labels,
+                         counter.queries)
+        if response.has_header('Content-Length'):
+            registry.observe('foodgram_http_response_size_bytes', labels,
+                             int(response['Content-Length']))
+        else:
+            registry.observe('foodgram_http_response_size_bytes', labels,
+                             len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = view_labels(view_func, request.method)
+
+    @staticmethod
+    def observe_stream(content, labels, counter):
+        size = 0
+        try:
+            for chunk in wrap_queries(content, counter):
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe('foodgram_http_db_queries', labels,
+                             counter.queries)
+            registry.observe('foodgram_http_response_size_bytes', labels,
+                             size)
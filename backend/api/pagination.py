@@ -1,7 +1,130 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 100
+
+
+class RecipeKeysetPagination(BasePagination):
+    """Курсорная пагинация ленты рецептов по ключу (date_published, id).
+
+    Вместо OFFSET и COUNT(*) страница выбирается условием на ключ последней
+    показанной записи, поэтому глубина страницы не влияет на стоимость
+    запроса. Курсор кодирует ключ записи и направление обхода.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = PageLimitPagination.page_size
+    page_size_query_param = PageLimitPagination.page_size_query_param
+    max_page_size = PageLimitPagination.max_page_size
+    invalid_cursor_message = 'Недопустимый курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by('-date_published', '-id')
+        else:
+            date_published, pk, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(date_published__gt=date_published)
+                    | Q(date_published=date_published, id__gt=pk)
+                ).order_by('date_published', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(date_published__lt=date_published)
+                    | Q(date_published=date_published, id__lt=pk)
+                ).order_by('-date_published', '-id')
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if reverse or has_more:
+                self.next_position = (results[-1], False)
+            if cursor is not None and (not reverse or has_more):
+                self.previous_position = (results[0], True)
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            date_published, pk, reverse = raw.split('|')
+            return (datetime.fromisoformat(date_published), int(pk),
+                    reverse == '1')
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        if position is None:
+            return None
+        recipe, reverse = position
+        raw = (f'{recipe.date_published.isoformat()}|{recipe.pk}|'
+               f'{int(reverse)}')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.encode_cursor(self.next_position),
+            'previous': self.encode_cursor(self.previous_position),
+            'results': data,
+        })
+
+
+class RecipePagination(PageLimitPagination):
+    """Пагинация ленты рецептов.
+
+    По умолчанию работает как PageLimitPagination (page/limit). Если в
+    запросе передан параметр cursor (в том числе пустой), используется
+    курсорный режим RecipeKeysetPagination.
+    """
+
+    cursor_pagination_class = RecipeKeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_pagination_class.cursor_query_param
+                in request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
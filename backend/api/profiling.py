@@ -0,0 +1,189 @@
+"""Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если пользователь — сотрудник из списка
+PROFILING_USERS (имя или email) и передал заголовок X-Profile или
+параметр ?profile=. Значения 1 и cprofile включают cProfile (файл .prof
+для pstats, snakeviz и т.п.), sample — выборочный профилировщик, который
+раз в PROFILING_SAMPLE_INTERVAL мс снимает стек потока запроса и
+сохраняет его в формате speedscope (.speedscope.json).
+
+Файлы складываются в PROFILING_DIR, хранятся последние PROFILING_KEEP,
+список доступен в админке по адресу /admin/profiles/. Без заголовка и
+параметра запрос не профилируется и проверки пользователя не делаются.
+"""
+import cProfile
+import io
+import json
+import pstats
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import CachedTokenAuthentication
+
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+SUFFIXES = {'cprofile': '.prof', 'sample': '.speedscope.json'}
+NAME = re.compile(r'^[\w.-]+$')
+
+
+def profiles_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def requested_mode(request):
+    """Режим профилирования, запрошенный заголовком или параметром."""
+    value = request.headers.get('X-Profile')
+    if value is None and 'profile=' in request.META.get('QUERY_STRING', ''):
+        value = request.GET.get('profile')
+    return MODES.get((value or '').lower())
+
+
+def profiling_allowed(request):
+    """Сотрудник из PROFILING_USERS; токен проверяется только здесь."""
+    user = request.user
+    if not user.is_authenticated:
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        if authenticated is None:
+            return False
+        user = authenticated[0]
+    allowed = settings.PROFILING_USERS
+    return user.is_staff and (user.get_username() in allowed
+                              or user.username in allowed)
+
+
+class SamplingProfiler:
+    """Снимает стек заданного потока через равные промежутки времени."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                stack.append(self.frames.setdefault(key, len(self.frames)))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def speedscope(self, name):
+        frames = [
+            {'name': function, 'file': filename, 'line': line}
+            for function, filename, line in self.frames
+        ]
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'foodgram',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'milliseconds',
+                'startValue': 0, 'endValue': sum(self.weights),
+                'samples': self.samples, 'weights': self.weights,
+            }],
+        }
+
+
+def profile_name(request, user_id, mode):
+    path = re.sub(r'[^\w]+', '_', request.path).strip('_') or 'root'
+    return (f'{datetime.now():%Y%m%d-%H%M%S-%f}-{user_id}-'
+            f'{request.method}-{path[:80]}{SUFFIXES[mode]}')
+
+
+def run_profiled(request, get_response, mode):
+    """Выполняет запрос под профилировщиком и сохраняет результат."""
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = profile_name(request, getattr(request.user, 'pk', None), mode)
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+        profiler.dump_stats(directory / name)
+    else:
+        sampler = SamplingProfiler(
+            settings.PROFILING_SAMPLE_INTERVAL / 1000
+        )
+        with sampler:
+            response = get_response(request)
+        (directory / name).write_text(json.dumps(
+            sampler.speedscope(f'{request.method} {request.get_full_path()}')
+        ), encoding='utf-8')
+    prune_profiles(directory)
+    response['X-Profile'] = name
+    return response
+
+
+def list_profiles():
+    """Сохранённые профили, новые первыми."""
+    directory = profiles_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in directory.iterdir():
+        if path.is_file() and path.name.endswith(tuple(SUFFIXES.values())):
+            stat = path.stat()
+            profiles.append({
+                'name': path.name,
+                'size': stat.st_size,
+                'created': datetime.fromtimestamp(stat.st_mtime),
+                'stats': path.suffix == '.prof',
+            })
+    return sorted(profiles, key=lambda item: item['created'], reverse=True)
+
+
+def prune_profiles(directory):
+    for profile in list_profiles()[settings.PROFILING_KEEP:]:
+        (directory / profile['name']).unlink(missing_ok=True)
+
+
+def profile_path(name):
+    """Путь к сохранённому профилю или None для чужого имени."""
+    if not NAME.match(name) or not name.endswith(tuple(SUFFIXES.values())):
+        return None
+    path = profiles_dir() / name
+    return path if path.is_file() else None
+
+
+def profile_stats(path, limit=40):
+    """Текстовая сводка pstats по совокупному времени."""
+    output = io.StringIO()
+    pstats.Stats(str(path), stream=output).sort_stats(
+        'cumulative'
+    ).print_stats(limit)
+    return output.getvalue()
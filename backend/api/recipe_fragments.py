@@ -0,0 +1,67 @@
+"""Кеш готовых фрагментов ответа о рецепте.
+
+Профиль автора, ингредиенты с названиями и единицами, картинка и текст
+рецепта одинаковы для всех пользователей, различаются только флаги
+is_favorited, is_in_shopping_cart и author.is_subscribed. Фрагмент —
+сериализованный рецепт без флагов и с относительными адресами картинок
+— хранится в кеше RESPONSE_CACHE_ALIAS под ключом recipe:<id>.
+RecipeSerializer берёт фрагменты страницы одним get_many, строит
+недостающие одним запросом ингредиентов (из основной базы, не из
+реплики) и добавляет флаги, посчитанные для страницы в основном запросе.
+
+Фрагменты удаляются сигналами (api.signals) при изменении рецепта, его
+ингредиентов, названий ингредиентов и профиля автора — сразу и после
+фиксации транзакции. Изменения в обход сигналов видны не позже
+RECIPE_FRAGMENT_CACHE_TIMEOUT.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from api.db_router import read_primary
+from api.metrics import record_cache
+from api.response_cache import get_cache
+
+
+def fragment_key(pk):
+    return f'recipe:{pk}'
+
+
+def get_fragments(recipes, render):
+    """Фрагменты рецептов {id: словарь}.
+
+    render(recipes) строит фрагменты рецептов, которых нет в кеше.
+    """
+    if not settings.RECIPE_FRAGMENT_CACHE_ENABLED:
+        return render(recipes)
+    cache = get_cache()
+    keys = {fragment_key(recipe.pk): recipe for recipe in recipes}
+    cached = cache.get_many(keys)
+    fragments = {keys[key].pk: fragment for key, fragment in cached.items()}
+    missing = [recipe for key, recipe in keys.items() if key not in cached]
+    record_cache('recipe_fragments', True, len(cached))
+    record_cache('recipe_fragments', False, len(missing))
+    if missing:
+        with read_primary():
+            rendered = render(missing)
+        cache.set_many(
+            {fragment_key(pk): fragment for pk, fragment in rendered.items()},
+            settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+        )
+        fragments.update(rendered)
+    return fragments
+
+
+def delete_fragments(recipe_ids):
+    get_cache().delete_many([fragment_key(pk) for pk in recipe_ids])
+
+
+def invalidate_fragments(recipe_ids):
+    """Удаляет фрагменты рецептов сразу и после фиксации транзакции."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    delete_fragments(recipe_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(delete_fragments, recipe_ids))
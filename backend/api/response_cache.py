@@ -0,0 +1,121 @@
+"""Кеш ответов ленты и страницы рецепта для анонимных пользователей.
+
+Для анонима флаги is_favorited, is_in_shopping_cart и is_subscribed
+всегда ложны, поэтому ответ зависит только от данных и параметров
+запроса. Данные ответа (до рендеринга, так что формат по-прежнему
+выбирается согласованием) хранятся в кеше Django RESPONSE_CACHE_ALIAS
+под ключом из поколения, действия, хоста и нормализованных параметров
+page, limit, cursor, author и name.
+
+Поколение — число в том же кеше. Сигналы сохранения и удаления Recipe,
+RecipeIngredient, Ingredient и профиля User увеличивают его (сразу и
+после фиксации транзакции), и все прежние ключи перестают
+использоваться без перебора; старые записи истекают сами. Изменения в
+обход сигналов (bulk_create, update, seed_data) видны не позже
+RESPONSE_CACHE_TIMEOUT. Ответ для кеша строится чтением из основной
+базы, а не из реплики (api.db_router).
+
+Бэкенд выбирается настройками (локальная память, файлы, Redis); при
+нескольких воркерах gunicorn нужен общий для них бэкенд.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from api.db_router import read_primary
+from api.metrics import record_cache
+
+GENERATION_KEY = 'recipes:generation'
+FILTER_PARAMS = ('author', 'name')
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def current_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Начальное значение от времени: если ключ поколения вытеснен,
+        # новое поколение не совпадёт с прежними.
+        generation = time.time_ns()
+        if not cache.add(GENERATION_KEY, generation, timeout=None):
+            generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_recipes():
+    """Делает недействительными все закешированные ответы.
+
+    Поколение увеличивается сразу и ещё раз после фиксации транзакции:
+    ответ, закешированный до фиксации, мог содержать прежние данные.
+    """
+    bump_generation()
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and not any(
+        entry[1] is bump_generation for entry in connection.run_on_commit
+    ):
+        transaction.on_commit(bump_generation)
+
+
+def cache_key(request, view, generation):
+    """Ключ ответа; прочие параметры запроса на ответ не влияют."""
+    params = request.query_params
+    normalized = {name: params[name] for name in FILTER_PARAMS
+                  if params.get(name)}
+    if view.action == 'list':
+        # Пустой cursor тоже включает курсорный режим.
+        if 'cursor' in params:
+            normalized['cursor'] = params['cursor']
+        else:
+            normalized['page'] = params.get('page') or '1'
+        normalized['limit'] = view.paginator.get_page_size(request)
+    query = '&'.join(f'{name}={value}'
+                     for name, value in sorted(normalized.items()))
+    digest = hashlib.sha1(
+        f'{request.scheme}://{request.get_host()}?{query}'.encode()
+    ).hexdigest()
+    return (f'recipes:{generation}:{view.action}:'
+            f'{view.kwargs.get(view.lookup_field, "")}:{digest}')
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных запросов."""
+
+    response_cache_name = 'recipe_responses'
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, method, request, *args, **kwargs):
+        if (not settings.RESPONSE_CACHE_ENABLED
+                or request.user.is_authenticated):
+            return method(request, *args, **kwargs)
+        cache = get_cache()
+        key = cache_key(request, self, current_generation(cache))
+        data = cache.get(key)
+        record_cache(self.response_cache_name, data is not None)
+        if data is not None:
+            return Response(data)
+        with read_primary():
+            response = method(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,123 @@
+"""Поиск ингредиентов по названию в памяти процесса.
+
+Справочник ингредиентов небольшой и меняется редко, а автодополнение
+формы рецепта запрашивает его на каждое нажатие клавиши. Вместо
+name__icontains (полный просмотр таблицы) индекс держит отсортированный
+список названий и карту триграмм: совпадения по началу названия ищутся
+бинарным поиском, вхождения подстроки — пересечением списков триграмм.
+
+Индекс строится при первом запросе и сбрасывается сигналами сохранения и
+удаления Ingredient, а также по истечении INGREDIENT_SEARCH_INDEX_TTL
+секунд: массовые операции и другие процессы сигналов не посылают.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.db_router import read_primary
+from api.metrics import record_cache
+from core.models import Ingredient
+
+
+def trigrams(text):
+    return {text[idx:idx + 3] for idx in range(len(text) - 2)}
+
+
+class IngredientSearchIndex:
+    """Неизменяемый индекс по списку ингредиентов."""
+
+    def __init__(self, rows):
+        rows = sorted(
+            (name.casefold(), pk, name, unit) for pk, name, unit in rows
+        )
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in rows
+        ]
+        postings = {}
+        for position, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(position)
+        self.postings = {
+            gram: array('I', positions) for gram, positions in postings.items()
+        }
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_db(cls):
+        return cls(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator())
+
+    def prefix_range(self, query):
+        return (bisect_left(self.keys, query),
+                bisect_left(self.keys, query + chr(0x10FFFF)))
+
+    def is_fresh(self):
+        ttl = settings.INGREDIENT_SEARCH_INDEX_TTL
+        return ttl is None or time.monotonic() - self.built_at <= ttl
+
+    def substring_positions(self, query):
+        """Позиции названий, содержащих query, в порядке сортировки."""
+        grams = trigrams(query)
+        if not grams:
+            return (
+                position for position, key in enumerate(self.keys)
+                if query in key
+            )
+        lists = sorted(
+            (self.postings.get(gram, ()) for gram in grams), key=len
+        )
+        candidates = set(lists[0])
+        for positions in lists[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                break
+        return (
+            position for position in sorted(candidates)
+            if query in self.keys[position]
+        )
+
+    def search(self, query, limit=None):
+        """Ингредиенты, начинающиеся с query, затем содержащие его."""
+        query = query.casefold()
+        start, end = self.prefix_range(query)
+        if limit is not None:
+            end = min(end, start + limit)
+        results = self.items[start:end]
+        for position in self.substring_positions(query):
+            if limit is not None and len(results) >= limit:
+                break
+            if not self.keys[position].startswith(query):
+                results.append(self.items[position])
+        return results
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс текущего процесса, при необходимости перестроенный."""
+    global _index
+    index = _index
+    hit = True
+    if index is None or not index.is_fresh():
+        with _lock:
+            index = _index
+            if index is None or not index.is_fresh():
+                with read_primary():
+                    index = _index = IngredientSearchIndex.from_db()
+                hit = False
+    record_cache('ingredient_search', hit)
+    return index
+
+
+def invalidate_index():
+    """Сбрасывает индекс текущего процесса."""
+    global _index
+    _index = None
@@ -1,9 +1,14 @@
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.manager import BaseManager
 from rest_framework import serializers
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from api.recipe_fragments import get_fragments
 from core.models import (
     Ingredient, Recipe, RecipeIngredient,
-    Favorite, ShoppingCart, User, Subscription
+    Favorite, ShoppingCart, User, Subscription, ShoppingListItem,
+    change_counters
 )
 
 
@@ -19,6 +24,8 @@ class UserProfileSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(
@@ -27,10 +34,21 @@ class UserProfileSerializer(UserSerializer):
         return False
 
 
-class RecipesUserSerializer(UserProfileSerializer):    
+MAX_RECIPES_LIMIT = 100
+
+
+def get_recipes_limit(request):
+    """Число рецептов в превью автора из параметра recipes_limit."""
+    try:
+        recipes_limit = int(request.GET['recipes_limit'])
+    except (KeyError, ValueError):
+        return MAX_RECIPES_LIMIT
+    return min(max(recipes_limit, 0), MAX_RECIPES_LIMIT)
+
+
+class RecipesUserSerializer(UserProfileSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -40,9 +58,11 @@ class RecipesUserSerializer(UserProfileSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit', 10**10)
-        recipes = obj.recipes.all()[:int(recipes_limit)]
+        if hasattr(obj, 'recipe_previews'):
+            recipes = obj.recipe_previews
+        else:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()[:recipes_limit]
         return SubscriptionRecipeSerializer(recipes, many=True,
                                             context=self.context).data
 
@@ -54,7 +74,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.CharField(source='ingredient.name', read_only=True)
     amount = serializers.IntegerField(min_value=1)
     measurement_unit = serializers.CharField(
@@ -66,6 +86,48 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Одинаковая для всех пользователей часть рецепта без флагов."""
+
+    author = UserProfileSerializer(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True
+    )
+    image = serializers.ImageField(read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'author', 'ingredients', 'name', 'image', 'text',
+            'cooking_time'
+        )
+
+
+def render_fragments(recipes):
+    """Фрагменты рецептов (api.recipe_fragments) одним запросом."""
+    prefetch_related_objects(recipes, 'author', Prefetch(
+        'recipe_ingredients',
+        queryset=RecipeIngredient.objects.select_related('ingredient')
+    ))
+    return {
+        recipe.pk: fragment for recipe, fragment in zip(
+            recipes, RecipeFragmentSerializer(recipes, many=True).data
+        )
+    }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: фрагменты берутся из кеша все сразу."""
+
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, BaseManager) else data
+        )
+        fragments = get_fragments(recipes, render_fragments)
+        return [self.child.with_flags(fragments[recipe.pk], recipe)
+                for recipe in recipes]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     author = UserProfileSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -83,37 +145,125 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_favorited', 'is_in_shopping_cart',
             'name', 'image', 'text', 'cooking_time'
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, recipe):
+        fragments = get_fragments([recipe], render_fragments)
+        return self.with_flags(fragments[recipe.pk], recipe)
+
+    def with_flags(self, fragment, recipe):
+        """Фрагмент рецепта с флагами пользователя и полными адресами."""
+        author = fragment['author']
+        author['is_subscribed'] = self.get_author_is_subscribed(recipe)
+        values = {
+            **fragment,
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+        }
+        request = self.context.get('request')
+        if request is not None:
+            for data, field in ((values, 'image'), (author, 'avatar')):
+                if data[field]:
+                    data[field] = request.build_absolute_uri(data[field])
+        return {name: values[name] for name in self.Meta.fields}
 
     @staticmethod
     def rec_save(recipe, data):
         RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=ingredient['id'],
+                ingredient=ingredient['ingredient'],
                 amount=ingredient.get('amount')
             ) for ingredient in data
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
         recipe = super().create(validated_data)
         self.rec_save(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('recipe_ingredients', None)
-        validated_ingredients = self.validate_ingredients(ingredients_data)
-        instance.recipe_ingredients.all().delete()
-        self.rec_save(instance, validated_ingredients)
+        ingredients_data = validated_data.pop('recipe_ingredients')
+        self.sync_ingredients(instance, ingredients_data)
         return super().update(instance, validated_data)
 
+    @staticmethod
+    def sync_ingredients(recipe, data):
+        """Приводит ингредиенты рецепта к переданным, меняя только разницу.
+
+        Изменённые количества обновляются одним bulk_update, новые
+        ингредиенты добавляются одним bulk_create, лишние удаляются одним
+        запросом. Счётчики и списки покупок меняются одним пакетом на всю
+        правку, а не по строке.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.only(
+                'id', 'ingredient_id', 'amount'
+            )
+        }
+        new_amounts = {
+            ingredient['ingredient'].pk: ingredient['amount']
+            for ingredient in data
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in existing
+        ])
+        removed = [
+            item for ingredient_id, item in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            # Удаление без сигналов post_delete: счётчики ингредиентов
+            # меняются одним пакетом, как и при bulk_create, списки
+            # покупок — в change_recipe ниже, а кеш ответов сбрасывает
+            # сохранение рецепта.
+            removed_items = RecipeIngredient.objects.filter(
+                pk__in=[item.pk for item in removed]
+            )
+            removed_items._raw_delete(removed_items.db)
+            change_counters(RecipeIngredient, removed, -1, removed_items.db)
+        ShoppingListItem.objects.change_recipe(
+            recipe, old_amounts, new_amounts
+        )
+
+    def get_author_is_subscribed(self, recipe):
+        if hasattr(recipe, 'author_is_subscribed'):
+            return recipe.author_is_subscribed
+        user = self.context['request'].user
+        return user.is_authenticated and Subscription.objects.filter(
+            user=user, author_id=recipe.author_id
+        ).exists()
+
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context['request'].user
         return user.is_authenticated and ShoppingCart.objects.filter(
             user=user, recipe=recipe
         ).exists()
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context['request'].user
         return user.is_authenticated and Favorite.objects.filter(
             user=user, recipe=recipe
@@ -122,14 +272,31 @@ class RecipeSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, ingredients):
         if not ingredients:
             raise serializers.ValidationError('Нет ингредиентов')
-        seen = set()
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in seen:
-                raise serializers.ValidationError('Ингредиенты повторяются.')
-            seen.add(ingredient_id)
+        ids = [ingredient['ingredient_id'] for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Ингредиенты повторяются.')
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [
+            str(ingredient_id) for ingredient_id in ids
+            if ingredient_id not in found
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {", ".join(missing)}.'
+            )
 
-        return ingredients
+        return [
+            {'ingredient': found[ingredient['ingredient_id']],
+             'amount': ingredient['amount']}
+            for ingredient in ingredients
+        ]
+
+    def validate(self, attrs):
+        if 'recipe_ingredients' not in attrs:
+            raise serializers.ValidationError(
+                {'ingredients': 'Нет ингредиентов'}
+            )
+        return attrs
 
     def validate_image(self, image):
         if not image:
@@ -142,3 +309,13 @@ class SubscriptionRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = fields
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
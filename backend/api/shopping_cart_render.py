@@ -1,27 +1,152 @@
+import csv
+import json
+import logging
+from abc import ABC, abstractmethod
+
+from django.conf import settings
 from django.utils.timezone import now
+from fontTools.ttLib import TTLibError
+from fpdf import FPDF
+from rest_framework.renderers import BaseRenderer
+
+logger = logging.getLogger(__name__)
+
+
+def shopping_cart_lines(user, ingredients, recipes):
+    """Построчно генерирует текст списка покупок пользователя."""
+
+    yield f"Список покупок для {user.username}"
+    yield f"Дата составления: {now().strftime('%d-%m-%Y %H:%M:%S')}"
+    yield ''
+    yield 'Продукты:'
+    yield ''
+    for idx, item in enumerate(ingredients, start=1):
+        yield (
+            f"{idx}. {item['ingredient__name'].capitalize()} "
+            f"({item['ingredient__measurement_unit']}) - "
+            f"{item['total_amount']}"
+        )
+    yield ''
+    yield 'Рецепты, использующие эти продукты:'
+    yield ''
+    for recipe in recipes:
+        yield f"- {recipe.name} (@{recipe.author.username})"
+
+
+class EchoBuffer:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class RendererUnavailable(Exception):
+    """Формат списка покупок сейчас не может быть построен."""
+
+
+class ShoppingCartRenderer(BaseRenderer, ABC):
+    """Базовый рендерер списка покупок.
+
+    Выбирается при согласовании формата (параметр ?format= или заголовок
+    Accept), а сам документ отдаётся потоком через stream(). Метод render()
+    используется только для ответов об ошибках.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    @property
+    def filename(self):
+        return f'shopping_list.{self.format}'
+
+    @abstractmethod
+    def stream(self, user, ingredients, recipes):
+        """Итератор байтов документа.
+
+        Всё, что может не получиться до первого байта, проверяется при
+        вызове и сообщается RendererUnavailable: после начала потока
+        ответ 200 уже отправлен.
+        """
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, user, ingredients, recipes):
+        for line in shopping_cart_lines(user, ingredients, recipes):
+            yield f'{line}\n'.encode(self.charset)
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, user, ingredients, recipes):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(
+            ('Продукт', 'Ед. изм.', 'Количество')
+        ).encode(self.charset)
+        for item in ingredients:
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['ingredient__measurement_unit'],
+                item['total_amount'],
+            )).encode(self.charset)
+        yield writer.writerow(()).encode(self.charset)
+        yield writer.writerow(('Рецепт', 'Автор')).encode(self.charset)
+        for recipe in recipes:
+            yield writer.writerow(
+                (recipe.name, recipe.author.username)
+            ).encode(self.charset)
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """PDF на A4 со встроенным подмножеством TrueType-шрифта (fpdf2).
+
+    Кириллица требует встроенного шрифта с ней, например DejaVuSans. PDF
+    собирается в памяти целиком и отдаётся одним куском после того, как
+    прочитаны все строки списка.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    margin = 50
+    font_size = 11
+    leading = 16
+
+    def stream(self, user, ingredients, recipes):
+        pdf = FPDF(unit='pt', format='A4')
+        pdf.set_margins(self.margin, self.margin)
+        pdf.set_auto_page_break(True, margin=self.margin)
+        try:
+            pdf.add_font('ShoppingCart',
+                         fname=settings.SHOPPING_CART_PDF_FONT)
+        except (OSError, TTLibError) as error:
+            logger.error('Шрифт для PDF не загружен: %s', error)
+            raise RendererUnavailable(
+                'Список покупок в формате PDF сейчас недоступен.'
+            ) from error
+        pdf.set_font('ShoppingCart', size=self.font_size)
+        return self.render_pdf(
+            pdf, shopping_cart_lines(user, ingredients, recipes)
+        )
+
+    def render_pdf(self, pdf, lines):
+        pdf.add_page()
+        for line in lines:
+            pdf.multi_cell(0, self.leading, line,
+                           new_x='LMARGIN', new_y='NEXT')
+        yield bytes(pdf.output())
 
 
-def render_shopping_cart(user, ingredients, recipes):
-    """Генерирует текст для списка покупок пользователя."""
-
-    shopping_cart_header = (
-        f"Список покупок для {user.username}\n"
-        f"Дата составления: {now().strftime('%d-%m-%Y %H:%M:%S')}\n"
-    )
-    ingredient_lines = [
-        f"{idx}. {item['ingredient__name'].capitalize()} "
-        f"({item['ingredient__measurement_unit']}) - {item['total_amount']}"
-        for idx, item in enumerate(ingredients, start=1)
-    ]
-    recipe_lines = [
-        f"- {recipe.name} (@{recipe.author.username})"
-        for recipe in recipes
-    ]
-    shopping_cart_text = '\n'.join([
-        shopping_cart_header,
-        'Продукты:\n',
-        *ingredient_lines,
-        '\nРецепты, использующие эти продукты:\n',
-        *recipe_lines,
-    ])
-    return shopping_cart_text
+SHOPPING_CART_RENDERERS = (
+    TextShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    PDFShoppingCartRenderer,
+)
@@ -0,0 +1,92 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.catalog import schedule_rebuild
+from api.recipe_fragments import invalidate_fragments
+from api.response_cache import invalidate_recipes
+from api.search import invalidate_index
+from core.models import Ingredient, Recipe, RecipeIngredient, User
+
+# Поля пользователя, входящие в профиль автора в ответах о рецептах.
+PROFILE_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar')
+)
+# Поля, сохранение которых не влияет на проверку токена.
+LOGIN_FIELDS = frozenset(('last_login',))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    """Сбрасывает индекс поиска и пересобирает снимок справочника.
+
+    Переименование ингредиента меняет фрагменты рецептов с ним; при
+    удалении фрагменты сбрасывает каскадное удаление RecipeIngredient.
+    """
+    invalidate_index()
+    schedule_rebuild()
+    invalidate_recipes()
+    if kwargs['signal'] is post_save and not created:
+        invalidate_fragments(RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Сбрасывает кеш ответов и фрагмент рецепта."""
+    invalidate_recipes()
+    invalidate_fragments([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Сбрасывает кеш ответов и фрагмент рецепта с ингредиентом."""
+    invalidate_recipes()
+    invalidate_fragments([instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(sender, instance, created=False, update_fields=None,
+                 **kwargs):
+    """Сбрасывает кеш ответов и фрагменты рецептов автора.
+
+    Новые пользователи и сохранения только служебных полей (last_login
+    при входе) кеш не трогают; рецепты удалённого пользователя удаляются
+    каскадом со своими сигналами.
+    """
+    if created:
+        return
+    if update_fields is None or PROFILE_FIELDS & set(update_fields):
+        invalidate_recipes()
+        if kwargs['signal'] is post_save:
+            invalidate_fragments(Recipe.objects.filter(
+                author=instance
+            ).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Убирает токен из кеша аутентификации.
+
+    Срабатывает при выходе (djoser token/logout) и каскадно при удалении
+    пользователя.
+    """
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_tokens_changed(sender, instance, created=False, update_fields=None,
+                        **kwargs):
+    """Убирает из кеша аутентификации токены изменённого пользователя.
+
+    Смена пароля и деактивация сохраняют пользователя целиком; запись
+    last_login при входе кеш не трогает.
+    """
+    if created or (update_fields is not None
+                   and set(update_fields) <= LOGIN_FIELDS):
+        return
+    invalidate_tokens(Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True))
@@ -0,0 +1,49 @@
+"""Общие данные для тестов api."""
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, User
+
+IMAGE = 'recipes/images/test.png'
+# Картинка 1x1 в base64 для полей Base64ImageField.
+PNG_DATA_URI = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwC'
+    'AAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII='
+)
+
+
+def create_user(username, **fields):
+    """Пользователь username с адресом username@example.com."""
+    name = username.capitalize()
+    return User.objects.create(**{
+        'email': f'{username}@example.com', 'username': username,
+        'first_name': name, 'last_name': name, **fields
+    })
+
+
+def new_recipe(author, name='Рецепт', **fields):
+    """Несохранённый рецепт, например для bulk_create."""
+    return Recipe(author=author, name=name, text='Описание',
+                  cooking_time=10, image=IMAGE, **fields)
+
+
+def create_recipe(author, name='Рецепт', **fields):
+    recipe = new_recipe(author, name, **fields)
+    recipe.save()
+    return recipe
+
+
+def create_ingredients(count):
+    """count ингредиентов «ингредиент N» в граммах."""
+    return Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {idx}', measurement_unit='г')
+        for idx in range(count)
+    )
+
+
+def token_client(user):
+    """Клиент с настоящим токеном пользователя (без force_authenticate)."""
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
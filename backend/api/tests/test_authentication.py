@@ -0,0 +1,124 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import token_cache, token_digest
+from api.metrics import registry
+from api.response_cache import get_cache
+from api.tests.fixtures import PNG_DATA_URI
+from core.models import User
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """Кеш проверенных токенов и его сброс."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='Secret-123',
+            first_name='User', last_name='User'
+        )
+
+    def setUp(self):
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_cached_lookup(self):
+        self.assertEqual(self.me().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.me()
+        self.assertEqual(response.data['email'], self.user.email)
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_logout(self):
+        self.me()
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_password_change_and_deactivation(self):
+        self.me()
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'Secret-123', 'new_password': 'Secret-456'
+        })
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(token_cache.entries), 0)
+        self.me()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_last_login_keeps_cache(self):
+        self.me()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(len(token_cache.entries), 1)
+
+    def test_stale_fields_not_saved(self):
+        # Аватар сохраняется во временный каталог, удаляемый после теста.
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.me()
+        User.objects.filter(pk=self.user.pk).update(recipes_count=5)
+        with self.settings(MEDIA_ROOT=media.name):
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': PNG_DATA_URI},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(
+            (Path(media.name) / self.user.avatar.name).exists()
+        )
+        self.assertEqual(self.user.recipes_count, 5)
+        self.assertTrue(self.user.check_password('Secret-123'))
+
+    def test_user_deleted(self):
+        self.me()
+        self.user.delete()
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(TOKEN_CACHE_SIZE=1)
+    def test_lru_eviction(self):
+        other = Token.objects.create(user=User.objects.create(
+            email='other@example.com', username='other'
+        ))
+        self.me()
+        APIClient().get('/api/users/me/',
+                        HTTP_AUTHORIZATION=f'Token {other.key}')
+        self.assertEqual(len(token_cache.entries), 1)
+        self.assertIsNotNone(token_cache.get(token_digest(other.key)))
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_expired(self):
+        self.me()
+        self.assertIsNone(token_cache.get(token_digest(self.token.key)))
+
+    @override_settings(TOKEN_CACHE_ALIAS='responses')
+    def test_shared_tier(self):
+        get_cache().clear()
+        registry.values.clear()
+        self.me()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.me().status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in queries.captured_queries))
+        hits = registry.values[('foodgram_cache_requests_total', (
+            ('cache', 'auth_tokens_shared'), ('result', 'hit')
+        ))]
+        self.assertEqual(hits, 1)
+        self.client.post('/api/auth/token/logout/')
+        token_cache.clear()
+        self.assertEqual(self.me().status_code, 401)
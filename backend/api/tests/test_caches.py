@@ -0,0 +1,136 @@
+from rest_framework.test import APITestCase
+
+from api.metrics import registry
+from api.response_cache import get_cache
+from api.serializers import RecipeSerializer
+from api.tests.fixtures import create_recipe, create_user
+from core.models import (
+    Favorite, Ingredient, RecipeIngredient, Subscription
+)
+
+
+class ResponseCacheTest(APITestCase):
+    """Кеш ответов ленты и страницы рецепта для анонимов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author)
+
+    def setUp(self):
+        get_cache().clear()
+        registry.values.clear()
+
+    def test_list_and_detail(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(second.status_code, 200)
+                self.assertEqual(second.json(), first.json())
+        self.assertEqual(registry.values[
+            'foodgram_cache_requests_total',
+            (('cache', 'recipe_responses'), ('result', 'hit'))
+        ], 2)
+
+    def test_normalized_query(self):
+        self.client.get('/api/recipes/')
+        for query in ('?page=1', '?limit=6&is_favorited=1', '?author='):
+            with self.assertNumQueries(0):
+                self.client.get(f'/api/recipes/{query}')
+        # Другой ключ ответа; фрагмент рецепта уже в кеше.
+        with self.assertNumQueries(2):
+            self.client.get('/api/recipes/', {'limit': 2})
+        with self.assertNumQueries(1):
+            self.client.get('/api/recipes/', {'cursor': ''})
+
+    def test_invalidation(self):
+        self.client.get('/api/recipes/')
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'],
+                         'Новое название')
+
+        self.author.last_name = 'Writer'
+        self.author.save()
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.author.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.data['author']['last_name'], 'Writer')
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.author)
+        self.client.get('/api/recipes/')
+        # COUNT и страница с флагами, фрагмент рецепта из кеша.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/recipes/')
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+
+
+class RecipeFragmentCacheTest(APITestCase):
+    """Фрагменты рецептов из кеша и флаги текущего пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.author = create_user('author')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+        cls.recipes = []
+        for idx in range(3):
+            recipe = create_recipe(cls.author, f'Рецепт {idx}')
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=idx + 1
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.viewer, recipe=cls.recipes[0])
+        Subscription.objects.create(user=cls.viewer, author=cls.author)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_authenticate(self.viewer)
+
+    def feed(self):
+        response = self.client.get('/api/recipes/')
+        return {recipe['id']: recipe for recipe in response.json()['results']}
+
+    def test_flags_merged(self):
+        uncached = self.feed()
+        # COUNT и страница с флагами; ингредиенты не запрашиваются.
+        with self.assertNumQueries(2):
+            cached = self.feed()
+        self.assertEqual(cached, uncached)
+        first = cached[self.recipes[0].pk]
+        self.assertEqual(list(first), list(RecipeSerializer.Meta.fields))
+        self.assertTrue(first['is_favorited'])
+        self.assertFalse(cached[self.recipes[1].pk]['is_favorited'])
+        self.assertTrue(first['author']['is_subscribed'])
+        self.assertTrue(first['image'].startswith('http://testserver/'))
+
+        self.client.force_authenticate(self.author)
+        first = self.feed()[self.recipes[0].pk]
+        self.assertFalse(first['is_favorited'])
+        self.assertFalse(first['author']['is_subscribed'])
+
+    def test_invalidation(self):
+        self.feed()
+        self.ingredient.name = 'морская соль'
+        self.ingredient.save()
+        self.author.first_name = 'Автор'
+        self.author.save()
+        recipe = self.feed()[self.recipes[1].pk]
+        self.assertEqual(recipe['ingredients'][0]['name'], 'морская соль')
+        self.assertEqual(recipe['author']['first_name'], 'Автор')
+
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[1].pk}/',
+            {'ingredients': [{'id': self.ingredient.pk, 'amount': 50}]},
+            format='json'
+        )
+        self.assertEqual(response.data['ingredients'][0]['amount'], 50)
+        recipe = self.client.get(f'/api/recipes/{self.recipes[1].pk}/').data
+        self.assertEqual(recipe['ingredients'][0]['amount'], 50)
@@ -0,0 +1,123 @@
+import json
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.db.models import Count, F
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import create_ingredients
+from core.management.commands.load_data import read_json_array
+from core.models import (
+    Ingredient, Recipe, ShoppingListItem, Subscription, User
+)
+
+
+class LoadDataTest(APITestCase):
+    """load_data загружает CSV, JSON и NDJSON, пропуская существующие."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = self.settings(
+            INGREDIENT_CATALOG_DIR=os.path.join(self.directory.name, 'catalog')
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def load(self, name, content, *args):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        out = StringIO()
+        call_command('load_data', path, '--batch-size', '2', *args,
+                     stdout=out, stderr=out)
+        return out.getvalue()
+
+    def test_csv(self):
+        output = self.load(
+            'ingredients.csv',
+            'соль,г\nсахар,г\n"мука, пшеничная",г\n\nбез единицы\nсахар,г\n'
+        )
+        self.assertIn('добавлено 2, пропущено 2 существующих, '
+                      'некорректных 1', output)
+        self.assertTrue(Ingredient.objects.filter(
+            name='мука, пшеничная', measurement_unit='г'
+        ).exists())
+
+        output = self.load('again.csv', 'сахар,г\nсахар,кг\n')
+        self.assertIn('добавлено 1, пропущено 1', output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_json_array_and_ndjson(self):
+        items = [{'name': f'ингредиент {idx}', 'measurement_unit': 'г'}
+                 for idx in range(5)]
+        output = self.load('ingredients.json', json.dumps(
+            items + [{'name': 'соль'}], ensure_ascii=False, indent=1
+        ))
+        self.assertIn('добавлено 5, пропущено 0 существующих, '
+                      'некорректных 1', output)
+
+        output = self.load('ingredients.ndjson', '\n'.join(
+            json.dumps(item, ensure_ascii=False) for item in items[:3]
+        ))
+        self.assertIn('добавлено 0, пропущено 3', output)
+        self.assertEqual(Ingredient.objects.count(), 6)
+
+    def test_json_array_read_in_chunks(self):
+        items = [{'name': f'ингредиент {idx}', 'measurement_unit': 'г'}
+                 for idx in range(50)]
+        content = json.dumps(items, ensure_ascii=False)
+        self.assertEqual(
+            list(read_json_array(StringIO(content), chunk_size=7)), items
+        )
+        with self.assertRaises(ValueError):
+            list(read_json_array(StringIO(content[:-1]), chunk_size=7))
+
+    def test_invalid_json(self):
+        output = self.load('broken.json', '[{"name": "перец", "measurem')
+        self.assertIn('Ошибка чтения файла', output)
+
+
+class SeedDataTest(APITestCase):
+    """seed_data создаёт согласованный набор данных."""
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        create_ingredients(30)
+
+    def test_seed(self):
+        call_command(
+            'seed_data', '--users', '20', '--recipes', '50',
+            '--batch-size', '7', '--carts', '4', stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertFalse(Subscription.objects.filter(
+            user=F('author')
+        ).exists())
+        self.assertTrue(all(
+            3 <= recipe.ingredient_count <= 12
+            for recipe in Recipe.objects.annotate(
+                ingredient_count=Count('recipe_ingredients')
+            )
+        ))
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            )),
+            sorted(ShoppingListItem.objects.expected().values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            ))
+        )
+        # Последовательности сдвинуты за явно заданные id.
+        self.assertEqual(
+            User.objects.create(username='new', email='new@example.com').pk,
+            21
+        )
@@ -0,0 +1,93 @@
+import importlib
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from api.db_router import PIN_COOKIE, PIN_HEADER
+from api.response_cache import get_cache
+from api.tests.fixtures import create_recipe, create_user
+from core.models import Ingredient
+
+
+class DatabaseSettingsTest(APITestCase):
+    """Настройки соединений SQLite и продакшена."""
+
+    @skipUnless(connection.vendor == 'sqlite', 'только для SQLite')
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_production_settings(self):
+        production = importlib.import_module('backend.settings_production')
+        self.assertFalse(production.DEBUG)
+        database = production.DATABASES['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertGreater(database['CONN_MAX_AGE'], 0)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertIn('statement_timeout', database['OPTIONS']['options'])
+
+
+@skipUnless('replica' in settings.DATABASES, 'нет базы replica')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(APITestCase):
+    """Чтения из реплики и привязка к основной базе после записи.
+
+    Реплику заменяет отдельная пустая тестовая база: данные, созданные в
+    основной, в ней не видны.
+    """
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.recipe = create_recipe(cls.viewer)
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_authenticate(self.viewer)
+
+    def test_safe_methods_read_replica(self):
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 0)
+        self.assertEqual(
+            self.client.get(f'/api/recipes/{self.recipe.pk}/').status_code,
+            404
+        )
+        self.assertEqual(self.client.get('/api/users/').data['count'], 0)
+        response = self.client.get(f'/api/ingredients/{self.ingredient.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pinned_after_write(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
+
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        response = client.get('/api/recipes/',
+                              HTTP_X_PIN_PRIMARY=response[PIN_HEADER])
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(client.get('/api/recipes/').data['count'], 0)
+
+    def test_failed_write_not_pinned(self):
+        response = self.client.post('/api/recipes/999/favorite/')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_expired_pin(self):
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 0)
+
+    def test_anonymous_cache_filled_from_primary(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
@@ -0,0 +1,102 @@
+import gzip
+import json
+from tempfile import TemporaryDirectory
+
+from rest_framework.test import APITestCase
+
+from api.catalog import build_snapshot
+from api.response_cache import bump_generation
+from api.search import invalidate_index
+from core.models import Ingredient
+
+
+class IngredientSearchTest(APITestCase):
+    """Поиск ингредиентов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('сахар', 'сахарная пудра', 'тростниковый сахар',
+                         'соль', 'ванильный сахар', 'масло')
+        )
+
+    def setUp(self):
+        invalidate_index()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [item['name'] for item in response.data]
+
+    def test_prefix_before_substring(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.search('Сах'), [
+                'сахар', 'сахарная пудра', 'ванильный сахар',
+                'тростниковый сахар'
+            ])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('с'), [
+                'сахар', 'сахарная пудра', 'соль',
+                'ванильный сахар', 'масло', 'тростниковый сахар'
+            ])
+
+    def test_limit(self):
+        with self.settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(self.search('сахар'),
+                             ['сахар', 'сахарная пудра'])
+
+    def test_signal_invalidation(self):
+        self.assertEqual(self.search('перец'), [])
+        Ingredient.objects.create(name='перец', measurement_unit='г')
+        self.assertEqual(self.search('перец'), ['перец'])
+
+
+class IngredientCatalogTest(APITestCase):
+    """Полный справочник отдаётся из снимка с поддержкой ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('сахар', 'соль', 'мука')
+        )
+
+    def setUp(self):
+        catalog_dir = TemporaryDirectory()
+        self.addCleanup(catalog_dir.cleanup)
+        override = self.settings(INGREDIENT_CATALOG_DIR=catalog_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_snapshot_and_conditional_get(self):
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['name'] for item in json.loads(response.content)],
+            ['мука', 'сахар', 'соль']
+        )
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))),
+                         3)
+
+    def test_rebuild_on_change(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Ingredient.objects.create(name='перец', measurement_unit='г')
+            Ingredient.objects.create(name='лук', measurement_unit='г')
+        # Одна пересборка снимка и одна смена поколения кеша ответов.
+        self.assertEqual(callbacks, [build_snapshot, bump_generation])
+
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 5)
@@ -0,0 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient, APITestCase
+
+from api.tests.fixtures import create_recipe, create_user, new_recipe
+from core.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, Subscription, User
+)
+
+
+class RecipeBatchTest(APITestCase):
+    """Пакетное добавление и удаление рецептов в избранное и корзину."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        ingredient = Ingredient.objects.create(name='соль',
+                                               measurement_unit='г')
+        cls.recipes = Recipe.objects.bulk_create(
+            new_recipe(cls.viewer, f'Рецепт {idx}') for idx in range(3)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=2)
+            for recipe in cls.recipes
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item['status']
+                for item in response.data['results']}
+
+    def test_favorite_batch(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        Favorite.objects.create(user=self.viewer, recipe_id=first)
+        # Вставка с RETURNING, счётчик избранного, проверка остальных
+        # рецептов; плюс SAVEPOINT транзакции.
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                '/api/recipes/favorite/batch/',
+                {'ids': [first, second, 999]}, format='json'
+            )
+        self.assertEqual(self.statuses(response), {
+            first: 'already_added', second: 'added', 999: 'not_found'
+        })
+
+        response = self.client.delete(
+            '/api/recipes/favorite/batch/',
+            {'ids': [first, third]}, format='json'
+        )
+        self.assertEqual(self.statuses(response), {
+            first: 'removed', third: 'not_added'
+        })
+        self.assertEqual(
+            list(Favorite.objects.values_list('recipe_id', flat=True)),
+            [second]
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('pk', 'favorites_count')),
+            {first: 0, second: 1, third: 0}
+        )
+
+    def test_shopping_cart_batch(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        self.client.post('/api/recipes/shopping_cart/batch/', {'ids': ids},
+                         format='json')
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.viewer).total_amount, 6
+        )
+        self.client.delete('/api/recipes/shopping_cart/batch/',
+                           {'ids': ids[:2]}, format='json')
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.viewer).total_amount, 2
+        )
+
+    def test_validation(self):
+        response = self.client.post('/api/recipes/favorite/batch/',
+                                    {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentLinkTest(TransactionTestCase):
+    """Параллельные повторные запросы не приводят к ошибкам 500."""
+
+    workers = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не допускает параллельной записи')
+        self.viewer = create_user('viewer')
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+
+    def hammer(self, url, method='post', data=None):
+        def send(_):
+            client = APIClient()
+            client.force_authenticate(self.viewer)
+            try:
+                return getattr(client, method)(
+                    url, data, format='json'
+                ).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            return sorted(executor.map(send, range(self.workers)))
+
+    def test_favorite(self):
+        statuses = self.hammer(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(statuses, [201] + [400] * (self.workers - 1))
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_shopping_cart(self):
+        statuses = self.hammer(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(statuses, [201] + [400] * (self.workers - 1))
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+
+    def test_subscribe(self):
+        statuses = self.hammer(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(statuses, [201] + [400] * (self.workers - 1))
+        self.assertEqual(Subscription.objects.count(), 1)
+
+    def test_missing_target(self):
+        self.assertEqual(set(self.hammer('/api/recipes/999/favorite/')),
+                         {404})
+
+    def test_unlink(self):
+        Favorite.objects.create(user=self.viewer, recipe=self.recipe)
+        statuses = self.hammer(f'/api/recipes/{self.recipe.pk}/favorite/',
+                               'delete')
+        self.assertEqual(statuses, [204] + [404] * (self.workers - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_batches(self):
+        ingredient = Ingredient.objects.create(name='соль',
+                                               measurement_unit='г')
+        recipes = [self.recipe, create_recipe(self.author, 'Рецепт 2')]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=2)
+            for recipe in recipes
+        )
+        data = {'ids': [recipe.pk for recipe in recipes]}
+        for url in ('/api/recipes/favorite/batch/',
+                    '/api/recipes/shopping_cart/batch/'):
+            self.assertEqual(set(self.hammer(url, data=data)), {200})
+        self.assertEqual(
+            list(Recipe.objects.values_list('favorites_count', flat=True)),
+            [1, 1]
+        )
+        item = ShoppingListItem.objects.get(user=self.viewer)
+        self.assertEqual((item.total_amount, item.recipe_count), (4, 2))
+
+        for url in ('/api/recipes/favorite/batch/',
+                    '/api/recipes/shopping_cart/batch/'):
+            self.assertEqual(set(self.hammer(url, 'delete', data)), {200})
+        self.assertEqual(
+            list(Recipe.objects.values_list('favorites_count', flat=True)),
+            [0, 0]
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class CountersTest(APITestCase):
+    """Счётчики рецептов, подписок и избранного следуют за связями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.viewer = create_user('viewer')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+        cls.recipe = create_recipe(cls.author)
+        RecipeIngredient.objects.create(recipe=cls.recipe,
+                                        ingredient=cls.ingredient, amount=1)
+
+    def counters(self):
+        self.author.refresh_from_db()
+        self.viewer.refresh_from_db()
+        self.ingredient.refresh_from_db()
+        return (self.author.recipes_count, self.author.subscribers_count,
+                self.viewer.subscriptions_count,
+                self.ingredient.recipes_count)
+
+    def test_links(self):
+        self.assertEqual(self.counters(), (1, 0, 0, 1))
+        self.client.force_authenticate(self.viewer)
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['results'][0]['recipes_count'], 1)
+
+        self.client.delete(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.counters(), (1, 0, 0, 1))
+
+    def test_cascade(self):
+        Subscription.objects.create(user=self.viewer, author=self.author)
+        Favorite.objects.create(user=self.viewer, recipe=self.recipe)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counters(), (0, 1, 1, 0))
+        self.viewer.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_bulk_create_conflicts_rejected(self):
+        Favorite.objects.create(user=self.viewer, recipe=self.recipe)
+        with self.assertRaises(ValueError):
+            Favorite.objects.bulk_create(
+                [Favorite(user=self.viewer, recipe=self.recipe)],
+                ignore_conflicts=True
+            )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_recount(self):
+        User.objects.filter(pk=self.author.pk).update(recipes_count=5)
+        Ingredient.objects.update(recipes_count=0)
+        output = StringIO()
+        call_command('recount', '--dry-run', stdout=output)
+        self.assertIn('User.recipes_count: неверных значений 1',
+                      output.getvalue())
+        self.assertIn('Ingredient.recipes_count: неверных значений 1',
+                      output.getvalue())
+        self.assertEqual(self.counters(), (5, 0, 0, 0))
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 0, 0, 1))
@@ -0,0 +1,248 @@
+import json
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from api.metrics import registry
+from api.search import invalidate_index
+from api.tests.fixtures import create_user, token_client
+from core.models import Ingredient, User
+
+
+class RequestTimingMiddlewareTest(APITestCase):
+    """Server-Timing и журнал медленных запросов с SQL-статистикой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+
+    def test_server_timing(self):
+        response = self.client.get('/api/users/')
+        metrics = dict(
+            metric.split(';', 1)
+            for metric in response['Server-Timing'].split(', ')
+        )
+        # COUNT и страница пользователей.
+        self.assertIn('desc="queries=2 duplicates=0"', metrics['db'])
+        self.assertIn('app', metrics)
+        self.assertIn('render', metrics)
+        self.assertIn('total', metrics)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_sampling_disabled(self):
+        response = self.client.get('/api/users/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING_SLOW_MS=0, REQUEST_TIMING_TOP_QUERIES=1)
+    def test_slow_request_log(self):
+        self.client.force_authenticate(self.viewer)
+        with self.assertLogs('api.timing', 'WARNING') as logs:
+            self.client.get(f'/api/users/{self.viewer.pk}/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'users-detail')
+        self.assertEqual(record['queries'], 1)
+        self.assertEqual(len(record['slow_queries']), 1)
+        self.assertIn('core_user', record['slow_queries'][0]['sql'])
+
+    @override_settings(REQUEST_TIMING_SLOW_MS=0)
+    def test_streaming_queries(self):
+        self.client.force_authenticate(self.viewer)
+        with self.assertLogs('api.timing', 'WARNING') as logs:
+            response = self.client.get('/api/recipes/download_shopping_cart/')
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['streamed'])
+        # Сводка списка покупок и рецепты читаются уже при отдаче потока.
+        self.assertEqual(record['queries'], 2)
+
+
+class RequestProfilerTest(APITestCase):
+    """Профилирование запроса сотрудником и страница профилей в админке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = create_user('staff', is_staff=True)
+        cls.viewer = create_user('viewer')
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin',
+            first_name='Admin', last_name='Admin'
+        )
+
+    def setUp(self):
+        profiles_dir = TemporaryDirectory()
+        self.addCleanup(profiles_dir.cleanup)
+        self.profiles_dir = profiles_dir.name
+        override = override_settings(
+            PROFILING_USERS=['staff', 'viewer@example.com', 'admin'],
+            PROFILING_DIR=self.profiles_dir,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_cprofile(self):
+        response = token_client(self.staff).get('/api/users/?profile=1')
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile']
+        self.assertTrue(name.endswith('.prof'))
+        self.assertEqual(os.listdir(self.profiles_dir), [name])
+
+    def test_sampling(self):
+        response = token_client(self.staff).get(
+            '/api/recipes/', HTTP_X_PROFILE='sample'
+        )
+        path = os.path.join(self.profiles_dir, response['X-Profile'])
+        with open(path, encoding='utf-8') as file:
+            profile = json.load(file)
+        self.assertEqual(profile['profiles'][0]['type'], 'sampled')
+        self.assertIn('frames', profile['shared'])
+
+    def test_not_allowed(self):
+        for client in (APIClient(), token_client(self.viewer)):
+            response = client.get('/api/users/?profile=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile', response)
+        self.assertEqual(os.listdir(self.profiles_dir), [])
+
+    @override_settings(PROFILING_KEEP=1)
+    def test_admin_profiles(self):
+        self.client.force_login(self.admin)
+        self.client.get('/api/users/', HTTP_X_PROFILE='1')
+        name = self.client.get(
+            '/api/ingredients/', HTTP_X_PROFILE='1'
+        )['X-Profile']
+        self.assertEqual(os.listdir(self.profiles_dir), [name])
+        response = self.client.get('/admin/profiles/')
+        self.assertContains(response, name)
+        response = self.client.get(f'/admin/profiles/{name}')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="{name}"')
+        response = self.client.get(f'/admin/profiles/{name}?stats=1')
+        self.assertContains(response, 'cumulative')
+        response = self.client.get('/admin/profiles/..%2Fmanage.py')
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsTest(APITestCase):
+    """Метрики представлений на /metrics и их сложение по воркерам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def setUp(self):
+        registry.values.clear()
+        catalog_dir = TemporaryDirectory()
+        self.addCleanup(catalog_dir.cleanup)
+        override = override_settings(INGREDIENT_CATALOG_DIR=catalog_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        invalidate_index()
+
+    def scrape(self):
+        response = APIClient().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_views(self):
+        self.client.force_authenticate(self.viewer)
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        self.client.get('/api/users/subscriptions/')
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        self.client.get('/api/ingredients/?name=му')
+        self.client.get('/api/ingredients/?name=мук')
+        samples = self.scrape()
+        labels = 'view="RecipeViewSet",action="list"'
+        self.assertEqual(samples[
+            f'foodgram_http_requests_total{{{labels},status="200"}}'
+        ], 2)
+        self.assertEqual(samples[
+            f'foodgram_http_request_duration_seconds_count{{{labels}}}'
+        ], 2)
+        self.assertEqual(samples[
+            f'foodgram_http_request_duration_seconds_bucket'
+            f'{{{labels},le="+Inf"}}'
+        ], 2)
+        self.assertGreater(samples[
+            f'foodgram_http_response_size_bytes_sum{{{labels}}}'
+        ], 0)
+        self.assertGreater(samples[
+            f'foodgram_http_db_queries_sum{{{labels}}}'
+        ], 0)
+        self.assertEqual(samples[
+            'foodgram_http_db_queries_sum'
+            '{view="RecipeViewSet",action="download_shopping_cart"}'
+        ], 2)
+        for view, action in (
+            ('UserManagementViewSet', 'subscriptions'),
+            ('RecipeViewSet', 'download_shopping_cart'),
+            ('IngredientViewSet', 'list'),
+        ):
+            self.assertIn(
+                f'foodgram_http_response_size_bytes_count'
+                f'{{view="{view}",action="{action}"}}', samples
+            )
+        self.assertEqual(samples[
+            'foodgram_cache_requests_total'
+            '{cache="ingredient_search",result="miss"}'
+        ], 1)
+        self.assertEqual(samples[
+            'foodgram_cache_requests_total'
+            '{cache="ingredient_search",result="hit"}'
+        ], 1)
+
+    def test_workers(self):
+        # Завершившийся процесс: его pid свободен.
+        finished = subprocess.Popen([sys.executable, '-c', ''])
+        finished.wait()
+        with TemporaryDirectory() as metrics_dir, \
+                override_settings(METRICS_DIR=metrics_dir):
+            self.client.get('/api/recipes/')
+            registry.flush()
+            files = os.listdir(metrics_dir)
+            self.assertEqual(files, [f'metrics_{os.getpid()}.json'])
+            with open(os.path.join(metrics_dir, files[0])) as file:
+                content = file.read()
+            # Файлы работающего (родительского) и завершённого процессов
+            # с теми же значениями.
+            for pid in (os.getppid(), finished.pid):
+                with open(os.path.join(metrics_dir, f'metrics_{pid}.json'),
+                          'w') as file:
+                    file.write(content)
+            samples = self.scrape()
+            self.assertNotIn(f'metrics_{finished.pid}.json',
+                             os.listdir(metrics_dir))
+        self.assertEqual(samples[
+            'foodgram_http_requests_total'
+            '{view="RecipeViewSet",action="list",status="200"}'
+        ], 2)
+
+    def test_access(self):
+        client = APIClient(REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(client.get('/metrics').status_code, 200)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer wrong'
+            ).status_code, 403)
+            self.assertEqual(client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+            ).status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 404)
@@ -0,0 +1,229 @@
+"""Бюджеты SQL-запросов и задержки основных эндпоинтов.
+
+Каждый эндпоинт из BUDGETS запрашивается на наборах данных нескольких
+размеров, и число запросов к БД должно совпадать с бюджетом на всех
+размерах: рост с размером означает N+1. При превышении печатаются
+запросы, сгруппированные по месту вызова в коде проекта.
+
+Бюджеты задержки проверяются, только если задана переменная окружения
+LATENCY_BUDGETS: на общих CI-машинах время ответа нестабильно.
+"""
+import os
+import time
+import traceback
+from collections import namedtuple
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework.test import APIClient, APITestCase
+
+from api.catalog import build_snapshot
+from api.response_cache import get_cache
+from api.search import get_index, invalidate_index
+from api.tests.fixtures import create_ingredients, create_user, new_recipe
+from core.models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, Subscription, User
+)
+
+Budget = namedtuple('Budget', 'name role url queries milliseconds cached',
+                    defaults=(False,))
+
+# role: None — аноним, 'viewer' — пользователь с подписками, избранным и
+# корзиной (аутентификация без запроса токена), 'admin' — суперпользователь
+# с сессией. В url подставляются {recipe}, {author} и {ingredient}.
+# Перед каждой строкой кеш ответов и фрагментов рецептов очищается, кроме
+# строк с cached=True: они повторяют предыдущую строку с заполненным кешем.
+BUDGETS = (
+    Budget('Лента рецептов', None, '/api/recipes/', 3, 150),
+    Budget('Лента рецептов', None, '/api/recipes/', 0, 50, cached=True),
+    Budget('Лента рецептов', 'viewer', '/api/recipes/', 3, 150),
+    Budget('Лента рецептов', 'viewer', '/api/recipes/', 2, 100,
+           cached=True),
+    Budget('Избранное', 'viewer', '/api/recipes/?is_favorited=1', 3, 150),
+    Budget('Рецепт', None, '/api/recipes/{recipe}/', 2, 100),
+    Budget('Рецепт', None, '/api/recipes/{recipe}/', 0, 50, cached=True),
+    Budget('Рецепт', 'viewer', '/api/recipes/{recipe}/', 2, 100),
+    Budget('Рецепт', 'viewer', '/api/recipes/{recipe}/', 1, 50,
+           cached=True),
+    Budget('Пользователи', None, '/api/users/', 2, 100),
+    Budget('Пользователи', 'viewer', '/api/users/', 2, 100),
+    Budget('Пользователь', 'viewer', '/api/users/{author}/', 1, 100),
+    Budget('Подписки', 'viewer', '/api/users/subscriptions/', 3, 150),
+    Budget('Подписки', 'viewer',
+           '/api/users/subscriptions/?recipes_limit=2', 3, 150),
+    Budget('Ингредиенты', None, '/api/ingredients/', 0, 50),
+    Budget('Поиск ингредиентов', None, '/api/ingredients/?name=ингр', 0, 50),
+    Budget('Ингредиент', None, '/api/ingredients/{ingredient}/', 1, 50),
+    Budget('Список покупок', 'viewer',
+           '/api/recipes/download_shopping_cart/', 2, 150),
+    Budget('Админка: пользователи', 'admin', '/admin/core/user/', 5, 300),
+    Budget('Админка: рецепты', 'admin', '/admin/core/recipe/', 8, 300),
+    Budget('Админка: ингредиенты', 'admin', '/admin/core/ingredient/', 6,
+           300),
+    Budget('Админка: избранное', 'admin', '/admin/core/favorite/', 7, 300),
+    Budget('Админка: подписки', 'admin', '/admin/core/subscription/', 7,
+           300),
+)
+
+# Число авторов и рецептов у каждого из них, а также ингредиентов в
+# каждом рецепте.
+SIZES = (1, 4, 12)
+
+
+def call_site():
+    """Ближайший к запросу кадр стека из кода проекта.
+
+    Если запрос выполнен целиком внутри библиотек (например, страницей
+    админки), возвращается ближайший кадр вне ORM.
+    """
+    base_dir = str(settings.BASE_DIR)
+    fallback = None
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if f'{os.sep}django{os.sep}db{os.sep}' in filename:
+            continue
+        if (filename.startswith(base_dir) and 'site-packages' not in filename
+                and filename not in (__file__, str(settings.BASE_DIR
+                                                   / 'manage.py'))):
+            path = Path(filename).relative_to(base_dir)
+            return f'{path}:{frame.lineno} в {frame.name}'
+        if fallback is None:
+            path = filename.split(f'site-packages{os.sep}')[-1]
+            fallback = f'{path}:{frame.lineno} в {frame.name}'
+    return fallback
+
+
+class QueryRecorder:
+    """Запоминает SQL и место вызова каждого запроса соединения."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((call_site(), sql))
+        return execute(sql, params, many, context)
+
+    def report(self):
+        sites = {}
+        for site, sql in self.queries:
+            sites.setdefault(site, []).append(sql)
+        lines = []
+        for site, queries in sorted(sites.items(),
+                                    key=lambda item: -len(item[1])):
+            lines.append(f'  {site}: {len(queries)}')
+            lines.extend(f'    {sql[:300]}' for sql in queries[:3])
+            if len(queries) > 3:
+                lines.append(f'    ... ещё {len(queries) - 3}')
+        return '\n'.join(lines)
+
+
+def build_dataset(size):
+    """Авторы с рецептами и зритель, подписанный на всех и всё добавивший.
+
+    Возвращает зрителя и значения для подстановки в url бюджетов.
+    """
+    viewer = create_user('viewer')
+    ingredients = create_ingredients(size * 2)
+    authors = User.objects.bulk_create(
+        User(email=f'author{idx}@example.com', username=f'author{idx}',
+             first_name='Автор', last_name=str(idx))
+        for idx in range(size)
+    )
+    recipes = Recipe.objects.bulk_create(
+        new_recipe(author, f'Рецепт {idx}')
+        for author in authors for idx in range(size)
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=idx + 1)
+        for recipe in recipes
+        for idx, ingredient in enumerate(ingredients[:size])
+    )
+    Subscription.objects.bulk_create(
+        Subscription(user=viewer, author=author) for author in authors
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            model(user=viewer, recipe=recipe) for recipe in recipes
+        )
+    ShoppingListItem.objects.add_recipes(
+        viewer, [recipe.pk for recipe in recipes]
+    )
+    # Снимок справочника и индекс поиска строятся заранее, как после
+    # первого обращения к ним в работающем процессе.
+    build_snapshot()
+    invalidate_index()
+    get_index()
+    return viewer, {
+        'recipe': recipes[-1].pk, 'author': authors[-1].pk,
+        'ingredient': ingredients[-1].pk,
+    }
+
+
+class QueryBudgetTest(APITestCase):
+    """Число запросов каждого эндпоинта не зависит от объёма данных."""
+
+    def setUp(self):
+        catalog_dir = TemporaryDirectory()
+        self.addCleanup(catalog_dir.cleanup)
+        override = self.settings(INGREDIENT_CATALOG_DIR=catalog_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin',
+            first_name='Admin', last_name='Admin'
+        )
+
+    def client_for(self, role, viewer):
+        if role == 'admin':
+            client = Client()
+            client.force_login(self.admin)
+        else:
+            client = APIClient()
+            if role == 'viewer':
+                client.force_authenticate(viewer)
+        return client
+
+    def measure(self, client, url):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response, recorder, elapsed
+
+    def test_budgets(self):
+        check_latency = bool(os.environ.get('LATENCY_BUDGETS'))
+        for size in SIZES:
+            with transaction.atomic():
+                viewer, values = build_dataset(size)
+                for budget in BUDGETS:
+                    url = budget.url.format(**values)
+                    client = self.client_for(budget.role, viewer)
+                    if not budget.cached:
+                        get_cache().clear()
+                    with self.subTest(budget=budget.name, role=budget.role,
+                                      url=url, size=size,
+                                      cached=budget.cached):
+                        response, recorder, elapsed = self.measure(
+                            client, url
+                        )
+                        self.assertEqual(response.status_code, 200)
+                        if len(recorder.queries) != budget.queries:
+                            self.fail(
+                                f'{len(recorder.queries)} запросов при '
+                                f'бюджете {budget.queries}:\n'
+                                + recorder.report()
+                            )
+                        if check_latency:
+                            self.assertLessEqual(
+                                elapsed, budget.milliseconds,
+                                f'{elapsed:.1f} мс при бюджете '
+                                f'{budget.milliseconds} мс'
+                            )
+                transaction.set_rollback(True)
@@ -0,0 +1,285 @@
+import re
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.response_cache import get_cache
+from api.serializers import RecipeSerializer
+from api.tests.fixtures import (
+    PNG_DATA_URI, create_ingredients, create_recipe, create_user, new_recipe
+)
+from core.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, Subscription
+)
+
+# Изменяющий запрос и его таблица.
+WRITE = re.compile(r'(UPDATE|DELETE) (?:FROM )?"?(\w+)"?')
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов к БД на страницу ленты не зависит от её размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        ingredients = create_ingredients(5)
+        for idx in range(10):
+            author = create_user(f'author{idx}')
+            recipe = create_recipe(author, f'Рецепт {idx}')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=idx + 1)
+                for ingredient in ingredients
+            )
+            if idx % 2:
+                Subscription.objects.create(user=cls.viewer, author=author)
+
+    def setUp(self):
+        # Считаются запросы без кеша ответов и фрагментов рецептов.
+        get_cache().clear()
+
+    def assert_page_queries(self, expected):
+        for limit in (1, 10):
+            with self.subTest(limit=limit):
+                # COUNT, страница рецептов, ингредиенты страницы.
+                with self.assertNumQueries(expected):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list(self):
+        self.assert_page_queries(3)
+
+    def test_authenticated_list(self):
+        self.client.force_authenticate(self.viewer)
+        self.assert_page_queries(3)
+
+    def test_is_subscribed_annotation(self):
+        self.client.force_authenticate(self.viewer)
+        response = self.client.get('/api/recipes/', {'limit': 10})
+        subscribed = set(Subscription.objects.filter(
+            user=self.viewer
+        ).values_list('author_id', flat=True))
+        for recipe in response.data['results']:
+            self.assertEqual(recipe['author']['is_subscribed'],
+                             recipe['author']['id'] in subscribed)
+
+    def test_retrieve(self):
+        recipe = Recipe.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(
+            sorted(item['id'] for item in response.data['ingredients']),
+            list(Ingredient.objects.order_by('id').values_list(
+                'id', flat=True
+            ))
+        )
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    """Курсорный режим ленты рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        published = timezone.now()
+        cls.recipes = Recipe.objects.bulk_create(
+            new_recipe(
+                cls.viewer, f'Рецепт {idx}',
+                # Пары рецептов с одинаковой датой проверяют разрыв связей
+                # по id.
+                date_published=published - timedelta(minutes=idx // 2)
+            )
+            for idx in range(9)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.viewer, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        )
+
+    def walk(self, params):
+        ids, url = [], '/api/recipes/'
+        response = self.client.get(url, {**params, 'cursor': ''})
+        while True:
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_matches_page_order(self):
+        expected = list(Recipe.objects.order_by(
+            '-date_published', '-id'
+        ).values_list('id', flat=True))
+        ids, last_page = self.walk({'limit': 2})
+        self.assertEqual(ids, expected)
+
+        previous = self.client.get(last_page.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in previous.data['results']],
+            expected[-3:-1]
+        )
+
+    def test_cursor_with_filters(self):
+        self.client.force_authenticate(self.viewer)
+        ids, _ = self.walk({'limit': 2, 'is_favorited': 1})
+        self.assertEqual(
+            sorted(ids), sorted(recipe.id for recipe in self.recipes[::2])
+        )
+
+    def test_page_number_is_default(self):
+        response = self.client.get('/api/recipes/', {'page': 2, 'limit': 4})
+        self.assertEqual(response.data['count'], 9)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeIngredientSyncTest(APITestCase):
+    """Правка рецепта меняет только изменившиеся ингредиенты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = create_ingredients(61)
+        cls.recipe = create_recipe(cls.author)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in cls.ingredients[:60]
+        )
+
+    def patch_ingredients(self, amounts):
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/',
+                {'ingredients': [
+                    {'id': ingredient.pk, 'amount': amount}
+                    for ingredient, amount in amounts.items()
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in queries.captured_queries
+            if 'core_recipeingredient' in query['sql']
+            and query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def test_unchanged_recipe_has_no_writes(self):
+        self.assertEqual(self.patch_ingredients(
+            {ingredient: 1 for ingredient in self.ingredients[:60]}
+        ), [])
+
+    def test_diff_writes(self):
+        amounts = {ingredient: 1 for ingredient in self.ingredients[1:60]}
+        amounts[self.ingredients[1]] = 5
+        amounts[self.ingredients[60]] = 3
+        ids_before = set(RecipeIngredient.objects.filter(
+            ingredient__in=self.ingredients[2:60]
+        ).values_list('id', flat=True))
+
+        writes = self.patch_ingredients(amounts)
+
+        self.assertEqual(
+            [sql.split()[0] for sql in writes], ['UPDATE', 'INSERT', 'DELETE']
+        )
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {ingredient.pk: amount for ingredient, amount in amounts.items()}
+        )
+        self.assertTrue(ids_before <= set(
+            self.recipe.recipe_ingredients.values_list('id', flat=True)
+        ))
+
+    def test_removal_batched(self):
+        buyer = create_user('buyer')
+        ShoppingCart.objects.create(user=buyer, recipe=self.recipe)
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/',
+                {'ingredients': [
+                    {'id': ingredient.pk, 'amount': 1}
+                    for ingredient in self.ingredients[:30]
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+        def writes(table):
+            return [
+                match[1] for query in queries.captured_queries
+                for match in [WRITE.match(query['sql'])]
+                if match and match[2] == table
+            ]
+
+        # Один DELETE строк и по одному UPDATE счётчиков и списка покупок
+        # на все 30 удалённых ингредиентов.
+        self.assertEqual(writes('core_recipeingredient'), ['DELETE'])
+        self.assertEqual(writes('core_ingredient'), ['UPDATE'])
+        self.assertEqual(writes('core_shoppinglistitem'),
+                         ['UPDATE', 'DELETE'])
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list(
+                'recipes_count', flat=True
+            )),
+            [0] * 31 + [1] * 30
+        )
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            )),
+            sorted(ShoppingListItem.objects.expected().values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            ))
+        )
+
+
+class RecipeIngredientValidationTest(APITestCase):
+    """Ингредиенты рецепта проверяются одним запросом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = create_ingredients(40)
+
+    def serializer(self, ids):
+        return RecipeSerializer(data={
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': PNG_DATA_URI,
+            'ingredients': [{'id': pk, 'amount': 2} for pk in ids],
+        })
+
+    def test_single_lookup(self):
+        serializer = self.serializer(
+            [ingredient.pk for ingredient in self.ingredients]
+        )
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(
+            [item['ingredient'] for item
+             in serializer.validated_data['recipe_ingredients']],
+            self.ingredients
+        )
+
+    def test_errors(self):
+        pk = self.ingredients[0].pk
+        for ids, message in (
+            ([pk, 999], 'Ингредиенты не найдены: 999.'),
+            ([pk, pk], 'Ингредиенты повторяются.'),
+            ([], 'Нет ингредиентов'),
+        ):
+            with self.subTest(ids=ids):
+                serializer = self.serializer(ids)
+                self.assertFalse(serializer.is_valid())
+                self.assertEqual(serializer.errors['ingredients'], [message])
@@ -0,0 +1,237 @@
+import os
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import create_ingredients, create_recipe, create_user
+from core.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    """Потоковая выгрузка списка покупок в разных форматах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        ingredients = create_ingredients(3)
+        for idx in range(4):
+            recipe = create_recipe(create_user(f'author{idx}'),
+                                   f'Рецепт {idx}')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=2)
+                for ingredient in ingredients
+            )
+            ShoppingCart.objects.create(user=cls.viewer, recipe=recipe)
+
+    def download(self, fmt=None):
+        self.client.force_authenticate(self.viewer)
+        # Сводка списка покупок и рецепты с авторами.
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/',
+                {'format': fmt} if fmt else {}
+            )
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return response, content
+
+    def test_text_is_default(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('filename="shopping_list.txt"',
+                      response['Content-Disposition'])
+        text = content.decode()
+        self.assertIn('1. Ингредиент 0 (г) - 8', text)
+        self.assertIn('- Рецепт 3 (@author3)', text)
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = content.decode().splitlines()
+        self.assertEqual(rows[0], 'Продукт,Ед. изм.,Количество')
+        self.assertIn('ингредиент 2,г,8', rows)
+        self.assertIn('Рецепт 0,author0', rows)
+
+    @skipUnless(os.path.exists(settings.SHOPPING_CART_PDF_FONT),
+                'Шрифт для PDF не установлен')
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+        # Встроено подмножество глифов, а не весь файл шрифта.
+        self.assertLess(len(content),
+                        os.path.getsize(settings.SHOPPING_CART_PDF_FONT) / 10)
+
+    def test_pdf_without_font(self):
+        self.client.force_authenticate(self.viewer)
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        broken = Path(directory.name) / 'broken.ttf'
+        # Обрезанный файл настоящего шрифта или просто не шрифт.
+        broken.write_bytes(
+            Path(settings.SHOPPING_CART_PDF_FONT).read_bytes()[:5000]
+            if os.path.exists(settings.SHOPPING_CART_PDF_FONT)
+            else b'not a font'
+        )
+        for font in ('/nonexistent/font.ttf', broken):
+            with self.subTest(font=font), \
+                    self.settings(SHOPPING_CART_PDF_FONT=str(font)), \
+                    self.assertLogs('api.shopping_cart_render', 'ERROR'):
+                response = self.client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': 'pdf'}
+                )
+                self.assertEqual(response.status_code, 500)
+                self.assertFalse(response.streaming)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json; charset=utf-8')
+                self.assertIn('error', response.json())
+
+
+class ShoppingListAggregateTest(APITestCase):
+    """Сводка списка покупок согласована с корзиной и рецептами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.buyers = [create_user(f'buyer{idx}') for idx in range(2)]
+        cls.ingredients = create_ingredients(4)
+        cls.recipes = []
+        for idx in range(2):
+            recipe = create_recipe(cls.author, f'Рецепт {idx}')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=idx + 1)
+                for ingredient in cls.ingredients[idx:idx + 3]
+            )
+            cls.recipes.append(recipe)
+
+    def assert_consistent(self):
+        expected = {
+            (item['user_id'], item['ingredient_id']): (
+                item['total_amount'], item['recipe_count']
+            )
+            for item in ShoppingListItem.objects.expected()
+        }
+        actual = {
+            (user_id, ingredient_id): (total_amount, recipe_count)
+            for user_id, ingredient_id, total_amount, recipe_count
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            )
+        }
+        self.assertEqual(actual, expected)
+
+    def test_cart_and_recipe_changes(self):
+        for buyer in self.buyers:
+            self.client.force_authenticate(buyer)
+            for recipe in self.recipes:
+                self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assert_consistent()
+
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].pk}/',
+            {'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 5},
+                {'id': self.ingredients[3].pk, 'amount': 7},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_consistent()
+
+        self.client.force_authenticate(self.buyers[0])
+        self.client.delete(
+            f'/api/recipes/{self.recipes[1].pk}/shopping_cart/'
+        )
+        self.assert_consistent()
+
+        self.client.force_authenticate(self.author)
+        self.client.delete(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assert_consistent()
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.buyers[0]).exists()
+        )
+
+    def test_author_deleted(self):
+        salt = self.ingredients[0]
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.buyers[0], recipe=recipe)
+        self.assert_consistent()
+
+        self.author.delete()
+
+        self.assert_consistent()
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.client.force_authenticate(self.buyers[0])
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertNotIn(salt.name.capitalize(),
+                         b''.join(response.streaming_content).decode())
+        out = StringIO()
+        call_command('rebuild_shopping_lists', dry_run=True, stdout=out)
+        self.assertIn(
+            'Отсутствует записей: 0, лишних: 0, с неверными значениями: 0',
+            out.getvalue()
+        )
+
+    def test_admin_edits(self):
+        cart = ShoppingCart.objects.create(user=self.buyers[0],
+                                           recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.buyers[1],
+                                    recipe=self.recipes[0])
+        self.assert_consistent()
+
+        cart.recipe = self.recipes[1]
+        cart.save()
+        self.assert_consistent()
+
+        item = self.recipes[0].recipe_ingredients.first()
+        item.amount = 10
+        item.save()
+        RecipeIngredient.objects.create(
+            recipe=self.recipes[0], ingredient=self.ingredients[3], amount=4
+        )
+        self.assert_consistent()
+
+        self.recipes[0].recipe_ingredients.last().delete()
+        self.ingredients[1].delete()
+        self.assert_consistent()
+
+        self.recipes[1].delete()
+        self.assert_consistent()
+
+    def test_rebuild_command(self):
+        for buyer in self.buyers:
+            ShoppingCart.objects.create(user=buyer, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.buyers[1],
+                                    recipe=self.recipes[1])
+        ShoppingListItem.objects.filter(user=self.buyers[0]).delete()
+        ShoppingListItem.objects.filter(
+            user=self.buyers[1], ingredient=self.ingredients[2]
+        ).update(total_amount=1)
+        ShoppingListItem.objects.create(
+            user=self.author, ingredient=self.ingredients[0],
+            total_amount=5, recipe_count=1
+        )
+        out = StringIO()
+        call_command('rebuild_shopping_lists', batch_size=1, stdout=out)
+        self.assertIn(
+            'Отсутствует записей: 3, лишних: 1, с неверными значениями: 1',
+            out.getvalue()
+        )
+        self.assert_consistent()
+
+        out = StringIO()
+        call_command('rebuild_shopping_lists', dry_run=True, stdout=out)
+        self.assertIn(
+            'Отсутствует записей: 0, лишних: 0, с неверными значениями: 0',
+            out.getvalue()
+        )
@@ -0,0 +1,52 @@
+from rest_framework.test import APITestCase
+
+from api.tests.fixtures import create_user, new_recipe
+from core.models import Recipe, Subscription, User
+
+
+class SubscriptionsQueriesTest(APITestCase):
+    """Список подписок строится фиксированным числом запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        for idx in range(8):
+            author = create_user(f'author{idx}')
+            Recipe.objects.bulk_create(
+                new_recipe(author, f'Рецепт {num}') for num in range(idx)
+            )
+            Subscription.objects.create(user=cls.viewer, author=author)
+
+    def test_subscriptions(self):
+        self.client.force_authenticate(self.viewer)
+        for limit in (2, 8):
+            with self.subTest(limit=limit):
+                # COUNT, страница авторов, превью рецептов.
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        '/api/users/subscriptions/',
+                        {'limit': limit, 'recipes_limit': 3}
+                    )
+                for author in response.data['results']:
+                    recipes_count = Recipe.objects.filter(
+                        author_id=author['id']
+                    ).count()
+                    self.assertTrue(author['is_subscribed'])
+                    self.assertEqual(author['recipes_count'], recipes_count)
+                    self.assertEqual(len(author['recipes']),
+                                     min(recipes_count, 3))
+
+    def test_subscription_order(self):
+        reader = create_user('reader')
+        authors = list(User.objects.filter(
+            username__startswith='author'
+        ).order_by('-username'))
+        for author in authors:
+            Subscription.objects.create(user=reader, author=author)
+        self.client.force_authenticate(reader)
+        response = self.client.get('/api/users/subscriptions/',
+                                   {'limit': len(authors)})
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            [author.pk for author in authors]
+        )
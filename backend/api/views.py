@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import reverse
 from rest_framework import viewsets, status, permissions
 from rest_framework.permissions import IsAuthenticated
@@ -8,35 +9,66 @@ from django.core.files.base import ContentFile
 import base64
 from core.models import (
     User, Ingredient, Recipe,
-    Favorite, ShoppingCart, Subscription,
-    RecipeIngredient
+    Favorite, ShoppingCart, Subscription, ShoppingListItem
 )
 from api.serializers import (
     UserProfileSerializer,
     IngredientSerializer,
     RecipeSerializer,
     SubscriptionRecipeSerializer,
-    RecipesUserSerializer
+    RecipesUserSerializer,
+    RecipeIdsSerializer,
+    get_recipes_limit
 )
-from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from api.pagination import PageLimitPagination
-from api.filters import RecipeFilter
+from api.pagination import RecipePagination
+from api.filters import RecipeFilter, favorite_exists, in_cart_exists
 from django.core.exceptions import ValidationError
 from djoser.views import UserViewSet
 from rest_framework import serializers
 from api.permissions import IsOwnerOrReadOnly
-from api.shopping_cart_render import render_shopping_cart
-from django.http import FileResponse
-from django.db.models import Sum
+from api.search import get_index
+from api.catalog import get_snapshot, snapshot_response
+from api.db_router import ReplicaReadMixin
+from api.response_cache import AnonymousResponseCacheMixin
+from api.shopping_cart_render import (
+    SHOPPING_CART_RENDERERS, RendererUnavailable
+)
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import (
+    Value, BooleanField, Exists, OuterRef, F, Window
+)
+from django.db.models.functions import RowNumber
+
 
+def get_pk_or_404(value):
+    """Приводит id из URL к числу, иначе отвечает 404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
 
-class UserManagementViewSet(UserViewSet):
+
+class UserManagementViewSet(ReplicaReadMixin, UserViewSet):
     """Кастомный ViewSet для управления пользователями с Djoser"""
     queryset = User.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            user = self.request.user
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                )
+            ) if user.is_authenticated else Value(
+                False, output_field=BooleanField()
+            ))
+        return queryset
+
     @action(detail=False, methods=['put'], url_path='me/avatar',
             permission_classes=[permissions.IsAuthenticated])
     def avatar(self, request):
@@ -75,18 +107,24 @@ class UserManagementViewSet(UserViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def subscribe(self, request, id=None):
         """Подписка на автора рецептов."""
-        author = get_object_or_404(User, pk=id)
-        if request.user == author:
+        author_id = get_pk_or_404(id)
+        if request.user.pk == author_id:
             raise serializers.ValidationError(
                 "Нельзя подписаться на самого себя."
             )
-        _, created = Subscription.objects.get_or_create(
-            user=request.user, author=author
-        )
+        try:
+            created = Subscription.objects.link(request.user, author_id)
+        except User.DoesNotExist:
+            raise Http404
         if not created:
             raise serializers.ValidationError(
-                f"Вы уже подписаны на пользователя {author.username}."
+                "Вы уже подписаны на пользователя "
+                f"{User.objects.get(pk=author_id).username}."
             )
+        author = User.objects.annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).get(pk=author_id)
+        self.attach_recipe_previews([author], get_recipes_limit(request))
         return Response(
             RecipesUserSerializer(author, context={'request': request}).data,
             status=status.HTTP_201_CREATED
@@ -95,60 +133,154 @@ class UserManagementViewSet(UserViewSet):
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
         """Отписка от автора рецептов."""
-        get_object_or_404(
-            Subscription, user=request.user, author_id=id
-        ).delete()
+        if not Subscription.objects.unlink(request.user, get_pk_or_404(id)):
+            raise Http404
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def attach_recipe_previews(authors, recipes_limit):
+        """Загружает превью рецептов сразу для всех авторов страницы.
+
+        Рецепты нумеруются оконной функцией ROW_NUMBER в пределах автора,
+        поэтому ограничение recipes_limit применяется одним запросом.
+        """
+        previews = {author.pk: [] for author in authors}
+        if previews and recipes_limit:
+            recipes = Recipe.objects.filter(
+                author_id__in=previews
+            ).annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('date_published').desc(), F('id').desc()),
+            )).filter(row_number__lte=recipes_limit).order_by(
+                'author_id', 'row_number'
+            )
+            for recipe in recipes:
+                previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipe_previews = previews[author.pk]
+
     @action(detail=False, methods=['get'],
             permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
         """Список подписок текущего пользователя."""
-        subscriptions = Subscription.objects.filter(
-            user=request.user
-        ).select_related('author')
-
-        queryset = [sub.author for sub in subscriptions]
+        # Авторы идут в порядке оформления подписок, как и раньше, когда
+        # список строился из подписок пользователя.
+        queryset = User.objects.filter(authors__user=request.user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('authors__id')
 
         page = self.paginate_queryset(queryset)
+        self.attach_recipe_previews(page, get_recipes_limit(request))
         return self.get_paginated_response(RecipesUserSerializer(
             page, many=True, context={'request': request}
         ).data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, AnonymousResponseCacheMixin,
+                    viewsets.ModelViewSet):
     """ViewSet для управления рецептами."""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = [permissions.IsAuthenticatedOrReadOnly,
                           IsOwnerOrReadOnly]
 
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = Recipe.objects.annotate(
+                is_favorited=favorite_exists(user),
+                is_in_shopping_cart=in_cart_exists(user),
+                author_is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('author')
+                )),
+            )
+        else:
+            false = Value(False, output_field=BooleanField())
+            queryset = Recipe.objects.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        if self.action in ('list', 'retrieve'):
+            # Ингредиенты загружаются только для рецептов, которых нет в
+            # кеше фрагментов (api.recipe_fragments).
+            queryset = queryset.select_related('author')
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     @staticmethod
+    @transaction.atomic
     def handle_recipe(model, user, recipe_id, add=True):
         """Общий метод для добавления и удаления рецептов"""
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        recipe_id = get_pk_or_404(recipe_id)
 
         if add:
-            _, created = model.objects.get_or_create(user=user,
-                                                     recipe=recipe)
+            try:
+                created = model.objects.link(user, recipe_id)
+            except Recipe.DoesNotExist:
+                raise Http404
+            recipe = Recipe.objects.get(pk=recipe_id)
             if not created:
                 raise serializers.ValidationError(
                     f'Рецепт "{recipe.name}" уже добавлен.'
                 )
+            if model is ShoppingCart:
+                ShoppingListItem.objects.add_recipes(user, [recipe_id])
             return Response(SubscriptionRecipeSerializer(recipe).data,
                             status=status.HTTP_201_CREATED)
 
-        get_object_or_404(model, user=user, recipe=recipe).delete()
+        if not model.objects.unlink(user, recipe_id):
+            raise Http404
+        if model is ShoppingCart:
+            ShoppingListItem.objects.remove_recipes(user, [recipe_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    @transaction.atomic
+    def handle_recipes(model, user, data, add=True):
+        """Пакетное добавление и удаление рецептов.
+
+        Связи вставляются одним INSERT ... SELECT или удаляются одним
+        DELETE. Результат для каждого id, сводка корзины и счётчики
+        строятся по id, которые вернул сам запрос (RETURNING), а не по
+        проверке до записи: параллельные запросы с теми же id не учтут
+        рецепт дважды.
+        """
+        serializer = RecipeIdsSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+
+        if add:
+            changed = model.objects.link_many(user, recipe_ids)
+            if model is ShoppingCart:
+                ShoppingListItem.objects.add_recipes(user, changed)
+            outcomes = {True: 'added', False: 'already_added'}
+        else:
+            changed = model.objects.unlink_many(user, recipe_ids)
+            if model is ShoppingCart:
+                ShoppingListItem.objects.remove_recipes(user, changed)
+            outcomes = {True: 'removed', False: 'not_added'}
+
+        unchanged = [pk for pk in recipe_ids if pk not in changed]
+        existing = changed | set(Recipe.objects.filter(
+            pk__in=unchanged
+        ).values_list('pk', flat=True) if unchanged else ())
+
+        return Response({'results': [
+            {'id': pk,
+             'status': outcomes[pk in changed] if pk in existing
+             else 'not_found'}
+            for pk in recipe_ids
+        ]})
+
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -167,29 +299,67 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def remove_shopping_cart(self, request, pk=None):
         return self.handle_recipe(ShoppingCart, request.user, pk, False)
 
-    @action(detail=False, methods=['get'],
+    @action(detail=False, methods=['post'], url_path='favorite/batch',
+            url_name='favorite-batch', permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.handle_recipes(Favorite, request.user, request.data, True)
+
+    @favorite_batch.mapping.delete
+    def remove_favorite_batch(self, request):
+        return self.handle_recipes(Favorite, request.user, request.data,
+                                   False)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart/batch',
+            url_name='shopping-cart-batch',
             permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.handle_recipes(ShoppingCart, request.user, request.data,
+                                   True)
+
+    @shopping_cart_batch.mapping.delete
+    def remove_shopping_cart_batch(self, request):
+        return self.handle_recipes(ShoppingCart, request.user, request.data,
+                                   False)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_CART_RENDERERS)
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок в формате текста."""
+        """Скачивание списка покупок в формате txt, csv или pdf."""
         user = request.user
         ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shopping_carts__user=user)  
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingListItem.objects
+            .filter(user=user)
+            .values('ingredient__name', 'ingredient__measurement_unit',
+                    'total_amount')
             .order_by('ingredient__name')
         )
 
-        recipes = Recipe.objects.filter(shopping_carts__user=user)
+        recipes = Recipe.objects.filter(
+            shopping_carts__user=user
+        ).select_related('author').only('name', 'author__username')
 
-        shopping_cart_text = render_shopping_cart(user, ingredients, recipes)
-
-        return FileResponse(
-            shopping_cart_text,
-            as_attachment=True,
-            filename='shopping_list.txt',
-            content_type='text/plain'
+        renderer = request.accepted_renderer
+        try:
+            content = renderer.stream(user, ingredients.iterator(),
+                                      recipes.iterator())
+        except RendererUnavailable as error:
+            return Response(
+                {'error': str(error)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content_type='application/json; charset=utf-8'
+            )
+        response = StreamingHttpResponse(
+            content,
+            content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            )
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{renderer.filename}"'
         )
+        return response
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
@@ -206,17 +376,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet для управления ингридиентами."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend,)
-    search_fields = ('^name',)
 
     def get_queryset(self):
-        queryset = Ingredient.objects.all().order_by('name')
-        name = self.request.query_params.get('name', None)
+        return Ingredient.objects.all().order_by('name')
+
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов.
+
+        Поиск по name идёт по индексу в памяти, полный список отдаётся из
+        готового снимка с поддержкой ETag.
+        """
+        name = request.query_params.get('name', None)
         if name:
-            queryset = queryset.filter(name__icontains=name)
-        return queryset
+            return Response(get_index().search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        return snapshot_response(request, get_snapshot())
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.RequestTimingMiddleware',
+    'api.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -82,25 +87,94 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-if DEBUG:
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
-        }
-    }
-else:
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.getenv('POSTGRES_DB', 'django'),
-            'USER': os.getenv('POSTGRES_USER', 'django'),
-            'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
-            'HOST': os.getenv('DB_HOST', 'db'),
-            'PORT': os.getenv('DB_PORT', '5432'),
-        }
+# SQLite для разработки и режима одного узла: журнал WAL (чтение не ждёт
+# записи), synchronous=NORMAL (fsync только при контрольной точке WAL),
+# отображение файла базы в память размером SQLITE_MMAP_SIZE байт и
+# транзакции IMMEDIATE с ожиданием блокировки до SQLITE_TIMEOUT секунд
+# вместо ошибки «database is locked».
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': int(os.getenv('SQLITE_TIMEOUT', 20)),
+    },
+}
+
+# PostgreSQL: постоянные соединения на DB_CONN_MAX_AGE секунд с проверкой
+# перед повторным использованием, ограничение времени запроса
+# DB_STATEMENT_TIMEOUT мс (0 — без ограничения) и подключения
+# DB_CONNECT_TIMEOUT с. DB_POOL=true включает пул соединений psycopg
+# (нужен пакет psycopg[pool]) вместо постоянных соединений: пул свой в
+# каждом воркере gunicorn, DB_POOL_MAX_SIZE обычно равен его --threads.
+DB_POOL = os.getenv('DB_POOL', 'false').lower() == 'true'
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+POSTGRESQL_DATABASE = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.getenv('POSTGRES_DB', 'django'),
+    'USER': os.getenv('POSTGRES_USER', 'django'),
+    'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
+    'HOST': os.getenv('DB_HOST', 'db'),
+    'PORT': os.getenv('DB_PORT', '5432'),
+    'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+    'CONN_HEALTH_CHECKS': not DB_POOL,
+    'OPTIONS': {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}',
+    },
+}
+if DB_POOL:
+    POSTGRESQL_DATABASE['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
     }
 
+# Реплики для чтения (api.db_router). PostgreSQL: адреса реплик через
+# запятую в DB_REPLICA_HOSTS, остальные параметры как у основной базы.
+# SQLite: если задан SQLITE_REPLICA_PATH, его файл заменяет реплику при
+# локальной проверке (например, копия db.sqlite3; репликации нет). Чтения
+# идут в реплики из DATABASE_REPLICAS — по умолчанию во все реплики
+# PostgreSQL, для SQLite нужно указать replica явно. REPLICA_PIN_SECONDS —
+# сколько секунд после записи клиент читает из основной базы; должно быть
+# больше отставания реплик.
+POSTGRESQL_REPLICAS = {
+    f'replica_{idx}': {**POSTGRESQL_DATABASE, 'HOST': host}
+    for idx, host in enumerate(
+        host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host
+    )
+}
+SQLITE_REPLICA_PATH = os.getenv('SQLITE_REPLICA_PATH')
+SQLITE_REPLICAS = {
+    'replica': {**SQLITE_DATABASE, 'NAME': SQLITE_REPLICA_PATH},
+} if SQLITE_REPLICA_PATH else {}
+
+DATABASES = {
+    'default': SQLITE_DATABASE if DEBUG else POSTGRESQL_DATABASE,
+    **(SQLITE_REPLICAS if DEBUG else POSTGRESQL_REPLICAS),
+}
+
+
+def database_replicas(databases):
+    """Алиасы реплик из DATABASE_REPLICAS, настроенные в databases."""
+    return [
+        alias for alias in os.getenv(
+            'DATABASE_REPLICAS', ','.join(POSTGRESQL_REPLICAS)
+        ).split(',') if alias in databases and alias != 'default'
+    ]
+
+
+DATABASE_REPLICAS = database_replicas(DATABASES)
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -149,7 +223,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -177,3 +251,130 @@ DJOSER = {
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# TrueType-шрифт с кириллицей для PDF-версии списка покупок.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Поиск ингредиентов для автодополнения: максимум результатов (None — без
+# ограничения) и время жизни индекса в памяти процесса, секунд.
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_SEARCH_INDEX_TTL = int(
+    os.getenv('INGREDIENT_SEARCH_INDEX_TTL', 300)
+)
+
+# Каталог готовых JSON-снимков справочника ингредиентов.
+INGREDIENT_CATALOG_DIR = os.getenv(
+    'INGREDIENT_CATALOG_DIR', os.path.join(MEDIA_ROOT, 'catalog')
+)
+
+# Кеш ответов ленты и страницы рецепта для анонимов (api.response_cache):
+# бэкенд кеша Django (FileBasedCache по умолчанию, RedisCache), его адрес
+# и время жизни записей, секунд. Бэкенд общий для всех воркеров gunicorn:
+# сброс кеша в одном из них должны видеть остальные, поэтому LocMemCache
+# годится только для одного процесса.
+RESPONSE_CACHE_ENABLED = os.getenv(
+    'RESPONSE_CACHE_ENABLED', 'true'
+).lower() == 'true'
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Кеш фрагментов рецептов без флагов пользователя (api.recipe_fragments)
+# в том же бэкенде: включён ли и время жизни фрагмента, секунд.
+RECIPE_FRAGMENT_CACHE_ENABLED = os.getenv(
+    'RECIPE_FRAGMENT_CACHE_ENABLED', 'true'
+).lower() == 'true'
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 3600)
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'KEY_PREFIX': 'foodgram',
+    },
+}
+
+# Кеш проверенных токенов (api.authentication): включён ли, число записей
+# и время их жизни в памяти процесса, с, а также алиас общего кеша Django
+# (пусто — без общего уровня) и время жизни записей в нём, с.
+TOKEN_CACHE_ENABLED = os.getenv(
+    'TOKEN_CACHE_ENABLED', 'true'
+).lower() == 'true'
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 10))
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', '')
+TOKEN_CACHE_SHARED_TTL = int(os.getenv('TOKEN_CACHE_SHARED_TTL', 300))
+
+# Замер SQL и времени обработки запросов (api.middleware): доля
+# замеряемых запросов (0 — выключено), порог медленного запроса в мс и
+# число SQL-запросов в его журнале, сбор текстов запросов для поиска
+# повторов и заголовок Server-Timing. По умолчанию замеряется 1%
+# запросов без текстов SQL; полный замер каждого запроса
+# (REQUEST_TIMING_SAMPLE_RATE=1, REQUEST_TIMING_DETAILED=true) включается
+# через окружение на время расследования. Журнал api.timing по умолчанию
+# содержит только медленные запросы, REQUEST_TIMING_LOG_LEVEL=INFO
+# включает строку для каждого замеренного.
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_TIMING_SAMPLE_RATE', 0.01)
+)
+REQUEST_TIMING_SLOW_MS = float(os.getenv('REQUEST_TIMING_SLOW_MS', 500))
+REQUEST_TIMING_TOP_QUERIES = int(os.getenv('REQUEST_TIMING_TOP_QUERIES', 5))
+REQUEST_TIMING_DETAILED = os.getenv(
+    'REQUEST_TIMING_DETAILED', 'false'
+).lower() == 'true'
+REQUEST_TIMING_HEADER = os.getenv(
+    'REQUEST_TIMING_HEADER', 'true'
+).lower() == 'true'
+
+# Профилирование запросов по требованию (api.profiling): сотрудники,
+# которым оно разрешено (имена или email через запятую; пусто — выключено),
+# каталог профилей, сколько их хранить и шаг выборочного профилировщика, мс.
+PROFILING_USERS = [
+    user for user in os.getenv('PROFILING_USERS', '').split(',') if user
+]
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', 50))
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', 1))
+
+# Метрики Prometheus на /metrics (api.metrics): включены ли, каталог для
+# файлов воркеров gunicorn (пусто — только метрики текущего процесса) и
+# период их записи, с. Доступ: адреса и сети через запятую из
+# METRICS_ALLOWED_IPS (по умолчанию только localhost) или любой адрес с
+# заголовком Authorization: Bearer <METRICS_TOKEN>.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+METRICS_ALLOWED_IPS = [
+    network for network in os.getenv(
+        'METRICS_ALLOWED_IPS', '127.0.0.0/8,::1'
+    ).split(',') if network
+]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_TIMING_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,25 @@
+"""Настройки для продакшена.
+
+Включаются переменной окружения
+DJANGO_SETTINGS_MODULE=backend.settings_production и отличаются от
+backend.settings выключенным DEBUG и выбором базы: PostgreSQL с
+постоянными соединениями или пулом и репликами для чтения
+(DATABASE_ENGINE=postgresql, по умолчанию) либо SQLite в режиме одного
+узла (DATABASE_ENGINE=sqlite).
+"""
+import os
+
+from backend.settings import *  # noqa: F401,F403
+from backend.settings import (
+    POSTGRESQL_DATABASE, POSTGRESQL_REPLICAS, SQLITE_DATABASE,
+    database_replicas
+)
+
+DEBUG = False
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'postgresql')
+if DATABASE_ENGINE == 'sqlite':
+    DATABASES = {'default': SQLITE_DATABASE}
+else:
+    DATABASES = {'default': POSTGRESQL_DATABASE, **POSTGRESQL_REPLICAS}
+DATABASE_REPLICAS = database_replicas(DATABASES)
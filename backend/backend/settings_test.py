@@ -0,0 +1,43 @@
+"""Настройки для тестов.
+
+manage.py выбирает их для команды test, если DJANGO_SETTINGS_MODULE не
+задан. Тестовая база SQLite создаётся в файле, а не в памяти: иначе
+соединения потоков не видят общих данных и ConcurrentLinkTest
+пропускается. Реплику для ReplicaRoutingTest заменяет отдельная пустая
+база replica. Журнал api.timing пишет только ошибки, иначе медленные
+запросы (например, со сменой пароля) выводили бы JSON с SQL посреди
+отчёта тестов. Загруженные файлы, снимки справочника ингредиентов,
+профили запросов и файловый кеш ответов пишутся во временный каталог,
+который удаляется по завершении прогона, а не в рабочую копию.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from backend.settings import *  # noqa: F401,F403
+from backend.settings import (
+    BASE_DIR, CACHES, DATABASES, LOGGING, RESPONSE_CACHE_ALIAS,
+    SQLITE_DATABASE
+)
+
+TEST_FILES_DIR = tempfile.mkdtemp(prefix='foodgram-tests-')
+atexit.register(shutil.rmtree, TEST_FILES_DIR, ignore_errors=True)
+MEDIA_ROOT = os.path.join(TEST_FILES_DIR, 'media')
+INGREDIENT_CATALOG_DIR = os.path.join(MEDIA_ROOT, 'catalog')
+PROFILING_DIR = os.path.join(TEST_FILES_DIR, 'profiles')
+if CACHES[RESPONSE_CACHE_ALIAS]['BACKEND'].endswith('FileBasedCache'):
+    CACHES[RESPONSE_CACHE_ALIAS]['LOCATION'] = os.path.join(
+        TEST_FILES_DIR, 'cache'
+    )
+
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    DATABASES.setdefault('replica', {
+        **SQLITE_DATABASE, 'NAME': BASE_DIR / 'replica.sqlite3'
+    })
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Тесты замера проверяют полный режим на каждом запросе.
+REQUEST_TIMING_SAMPLE_RATE = 1
+REQUEST_TIMING_DETAILED = True
+LOGGING['loggers']['api.timing']['level'] = 'ERROR'
@@ -0,0 +1,60 @@
+"""Бенчмарки бэкенда.
+
+Скрипты запускаются из каталога backend, например::
+
+    python -m benchmarks.ingredient_search
+
+и работают на временной тестовой базе, не затрагивая рабочую.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def django_test_db(settings_module='backend.settings', test_name=None):
+    """Настраивает Django и создаёт временную тестовую базу.
+
+    test_name задаёт имя тестовой базы, например файл SQLite вместо базы в
+    памяти, чтобы к ней могли подключиться другие процессы.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment, teardown_test_environment
+    )
+
+    setup_test_environment()
+    if test_name is not None:
+        connection.settings_dict['TEST']['NAME'] = test_name
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Время выполнения func в миллисекундах для каждого из повторов."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(timings):
+    """Среднее, перцентили и максимум списка замеров, мс."""
+    ordered = sorted(timings)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'max': ordered[-1],
+    }
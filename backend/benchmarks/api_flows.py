@@ -0,0 +1,508 @@
+"""Замер задержек API по сценариям Postman-коллекции.
+
+Запуск из каталога backend::
+
+    python -m benchmarks.api_flows [--iterations 50] [--workers 4]
+        [--executor thread|process] [--recipes 10000]
+        [--base-url http://127.0.0.1:8000]
+        [--output run.json] [--compare previous.json]
+
+Сначала коллекция postman_collection/foodgram.postman_collection.json
+проходится один раз по порядку, без папки delete_requests: создаются
+пользователи, токены и рецепты, а переменные коллекции заполняются из
+ответов так же, как это делают её тестовые скрипты. Затем каждый
+GET-запрос коллекции выполняется --iterations раз в пуле потоков или
+процессов, и для него считаются перцентили задержки, пропускная
+способность и число SQL-запросов.
+
+Изменяющие запросы замеряются сценариями WRITE_FLOWS: пара шагов
+коллекции (например, удаление из избранного и повторное добавление)
+возвращает данные в состояние после первого прохода, поэтому сценарий
+повторяется --iterations раз, а прогоны сравнимы между собой. Сценарии
+выполняются последовательно одним клиентом: параллельные повторы одного
+сценария мешали бы друг другу.
+
+Без --base-url запросы идут через тестовый клиент Django на временной
+базе (с --recipes она дополняется командой seed_data), с --base-url — по
+HTTP к уже запущенному серверу; число SQL-запросов тогда берётся из
+заголовка Server-Timing, если сервер его отдаёт (для каждого запроса —
+при REQUEST_TIMING_SAMPLE_RATE=1).
+Результат сохраняется в JSON, --compare печатает изменения p95 и числа
+запросов относительно прошлого прогона.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from http.client import HTTPException
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import quote
+
+from benchmarks import django_test_db, summary
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+COLLECTION_PATH = (BASE_DIR.parent / 'postman_collection'
+                   / 'foodgram.postman_collection.json')
+SKIPPED_FOLDERS = ('delete_requests',)
+VARIABLE = re.compile(r'{{(\w+)}}')
+LOCAL = re.compile(r'const (\w+) = _\.get\(responseData, "(\w+)"\)')
+SET = re.compile(
+    r"""pm\.collectionVariables\.set\(['"](\w+)['"],\s*(.+?)\);?\s*$"""
+)
+SERVER_TIMING_QUERIES = re.compile(r'\bdb;[^,]*\bqueries=(\d+)')
+INDEXED = re.compile(
+    r'responseData\[(\d+)\]\.(\w+)(?:\.slice\((\d+),\s*(\d+)\))?$'
+)
+# Сценарии изменяющих запросов: шаги коллекции («папки/имя») в порядке
+# выполнения. Каждый сценарий возвращает данные в исходное состояние.
+WRITE_FLOWS = {
+    'favorite': (
+        'delete_requests/favorite/remove_from_favorite // User',
+        'favorite/add_to_favorite/add_to_favorite // User',
+    ),
+    'shopping_cart': (
+        'delete_requests/shopping_cart/remove_from_shopping_cart // User',
+        'shopping_cart/add_to_shopping_cart/add_to_shopping_cart // User',
+    ),
+    'subscription': (
+        'delete_requests/subscriptions/delete_first_subscription // User',
+        'subscriptions/create_subscriptions/create_subscription // User',
+    ),
+    'recipe': (
+        'recipes/create_recipes/create_fifth_recipe // User',
+        'delete_requests/recipes/delete_fifth_recipe // Second User',
+    ),
+    'recipe_update': (
+        'recipes/update_recipes/update_recipe // Second User',
+    ),
+    'avatar': (
+        'users/set_avatars // User/set_avatar // User',
+        'users/delete_avatar // User/delete_avatar // User',
+    ),
+}
+
+
+class Step:
+    """Запрос коллекции с правилами заполнения переменных из ответа."""
+
+    def __init__(self, item, folders, auth):
+        request = item['request']
+        self.name = item['name']
+        self.folders = folders
+        self.method = request['method']
+        url = request['url']
+        self.url = (url['raw'] if isinstance(url, dict) else url).replace(
+            '{{baseUrl}}', ''
+        ).strip()
+        self.headers = {
+            header['key']: header['value']
+            for header in request.get('header', [])
+            if not header.get('disabled')
+        }
+        auth = request.get('auth', auth)
+        if auth and auth['type'] == 'apikey':
+            params = {param['key']: param['value'] for param in auth['apikey']}
+            self.headers[params['key']] = params['value']
+        self.authorized = 'Authorization' in self.headers
+        body = request.get('body') or {}
+        self.body = body.get('raw') if self.method != 'GET' else None
+        if self.body:
+            self.headers.setdefault('Content-Type', 'application/json')
+        self.extract = self.parse_extract(item.get('event', []))
+
+    @staticmethod
+    def parse_extract(events):
+        """Пары (переменная, ключ ответа или (индекс, ключ, срез))."""
+        rules = []
+        for event in events:
+            if event['listen'] != 'test':
+                continue
+            lines = event['script']['exec']
+            local = dict(
+                match.groups() for line in lines
+                for match in [LOCAL.search(line)] if match
+            )
+            for line in lines:
+                match = SET.search(line.strip())
+                if not match:
+                    continue
+                variable, expression = match.groups()
+                if expression in local:
+                    rules.append((variable, local[expression]))
+                elif indexed := INDEXED.match(expression):
+                    index, key, start, end = indexed.groups()
+                    rules.append((variable, (
+                        int(index), key,
+                        slice(int(start), int(end)) if start else None
+                    )))
+        return rules
+
+    @property
+    def path(self):
+        return '/'.join((*self.folders, self.name))
+
+    @property
+    def in_setup(self):
+        """Шаг выполняется при первом проходе коллекции."""
+        return self.folders[:1] not in [(name,) for name in SKIPPED_FOLDERS]
+
+    @property
+    def endpoint(self):
+        path = VARIABLE.sub(lambda match: '{' + match[1] + '}', self.url)
+        return f'{self.method} {path}' + (' [token]' if self.authorized
+                                          else '')
+
+    def resolve(self, variables):
+        """Метод, путь, заголовки и тело с подставленными переменными."""
+        def substitute(text):
+            return VARIABLE.sub(
+                lambda match: str(variables.get(match[1], '')), text
+            )
+
+        return (
+            self.method, substitute(self.url),
+            {key: substitute(value) for key, value in self.headers.items()},
+            substitute(self.body) if self.body else None,
+        )
+
+    def update(self, variables, content):
+        """Заполняет переменные из ответа, как тестовый скрипт Postman."""
+        if not self.extract:
+            return
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return
+        for variable, rule in self.extract:
+            if isinstance(rule, str):
+                value = data.get(rule) if isinstance(data, dict) else None
+            else:
+                index, key, part = rule
+                try:
+                    value = data[index][key]
+                except (IndexError, KeyError, TypeError):
+                    continue
+                if part is not None:
+                    value = value[part]
+            if value:
+                variables[variable] = value
+
+
+def load_steps(path=COLLECTION_PATH):
+    """Переменные коллекции и все её запросы в порядке выполнения."""
+    with open(path, encoding='utf-8') as file:
+        collection = json.load(file)
+
+    def walk(items, folders, auth):
+        for item in items:
+            if 'item' in item:
+                yield from walk(item['item'], folders + (item['name'],),
+                                item.get('auth', auth))
+            else:
+                yield Step(item, folders, auth)
+
+    variables = {
+        variable['key']: variable['value']
+        for variable in collection.get('variable', [])
+    }
+    return variables, list(walk(collection['item'], (), None))
+
+
+class InProcessClient:
+    """Запросы через тестовый клиент Django с подсчётом SQL-запросов."""
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, method, path, headers, body):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        headers = dict(headers)
+        content_type = headers.pop('Content-Type', 'application/json')
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.generic(
+                method, path, body or '', content_type=content_type,
+                headers=headers
+            )
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, content, elapsed, len(queries)
+
+
+class HttpClient:
+    """Запросы по HTTP к запущенному серверу."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, headers, body):
+        request = urllib.request.Request(
+            self.base_url + quote(path, safe='/?=&%:'), method=method,
+            headers=headers,
+            data=body.encode('utf-8') if body else None
+        )
+        started = time.perf_counter()
+        server_timing = ''
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, content = response.status, response.read()
+                server_timing = response.headers.get('Server-Timing', '')
+        except HTTPError as error:
+            status, content = error.code, error.read()
+            server_timing = error.headers.get('Server-Timing', '')
+        except (OSError, HTTPException):
+            status, content = 0, b''
+        elapsed = (time.perf_counter() - started) * 1000
+        queries = SERVER_TIMING_QUERIES.search(server_timing)
+        return status, content, elapsed, (
+            int(queries[1]) if queries else None
+        )
+
+
+_worker = threading.local()
+
+
+def init_worker(base_url, db_name):
+    """Готовит клиента в процессе пула."""
+    if base_url:
+        _worker.client = HttpClient(base_url)
+        return
+    from django.db import connections
+
+    # Соединения, унаследованные от родительского процесса, не
+    # используются: процесс открывает свои к той же тестовой базе.
+    connections.close_all()
+    connections['default'].settings_dict['NAME'] = db_name
+    _worker.client = InProcessClient()
+
+
+def run_request(args):
+    """Выполняет запрос клиентом текущего потока или процесса."""
+    base_url, request = args
+    if not hasattr(_worker, 'client'):
+        _worker.client = (HttpClient(base_url) if base_url
+                          else InProcessClient())
+    status, _, elapsed, queries = _worker.client.request(*request)
+    return status, elapsed, queries
+
+
+def run_setup(client, variables, steps):
+    """Проходит коллекцию по порядку и возвращает результаты запросов."""
+    results = []
+    for step in steps:
+        if not step.in_setup:
+            continue
+        status, content, elapsed, queries = client.request(
+            *step.resolve(variables)
+        )
+        step.update(variables, content)
+        results.append({
+            'name': step.path,
+            'endpoint': step.endpoint, 'status': status,
+            'ms': round(elapsed, 3), 'queries': queries,
+        })
+    return results
+
+
+def endpoint_stats(results, wall):
+    """Статистика серии: results — тройки (код, мс, SQL-запросов)."""
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'statuses': statuses,
+        'rps': round(len(results) / wall, 2),
+        **{key: round(value, 3) for key, value in summary(
+            [elapsed for _, elapsed, _ in results]
+        ).items()},
+        'queries': max(queries) if queries else None,
+    }
+
+
+def run_endpoints(executor, base_url, variables, steps, iterations):
+    """Замеры каждого GET-запроса коллекции отдельной серией."""
+    endpoints = {}
+    for step in steps:
+        if (step.method != 'GET' or not step.in_setup
+                or step.endpoint in endpoints):
+            continue
+        request = step.resolve(variables)
+        started = time.perf_counter()
+        results = list(executor.map(
+            run_request, [(base_url, request)] * iterations
+        ))
+        endpoints[step.endpoint] = endpoint_stats(
+            results, time.perf_counter() - started
+        )
+    return endpoints
+
+
+def run_flows(client, variables, steps, iterations):
+    """Замеры изменяющих запросов сценариев WRITE_FLOWS.
+
+    Переменные, которые заполняет шаг сценария (например, id созданного
+    рецепта), видны только следующим шагам того же повтора.
+    """
+    by_path = {step.path: step for step in steps}
+    endpoints = {}
+    for flow in WRITE_FLOWS.values():
+        flow_steps = [by_path[path] for path in flow]
+        results = {step.path: [] for step in flow_steps}
+        for _ in range(iterations):
+            flow_variables = dict(variables)
+            for step in flow_steps:
+                status, content, elapsed, queries = client.request(
+                    *step.resolve(flow_variables)
+                )
+                step.update(flow_variables, content)
+                results[step.path].append((status, elapsed, queries))
+        for step in flow_steps:
+            timings = results[step.path]
+            endpoints[step.endpoint] = endpoint_stats(
+                timings, sum(elapsed for _, elapsed, _ in timings) / 1000
+            )
+    return endpoints
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Печатает изменения p95 и числа запросов по общим эндпоинтам."""
+    print(f'\nСравнение с {previous.get("revision") or "прошлым прогоном"}:')
+    for endpoint, stats in current['endpoints'].items():
+        old = previous.get('endpoints', {}).get(endpoint)
+        if old is None:
+            continue
+        change = (stats['p95'] - old['p95']) / old['p95'] * 100 \
+            if old['p95'] else 0
+        line = (f'  {endpoint:<58} p95 {old["p95"]:8.2f} -> '
+                f'{stats["p95"]:8.2f} мс ({change:+.0f}%)')
+        if old.get('queries') != stats.get('queries'):
+            line += f'  запросов {old.get("queries")} -> {stats["queries"]}'
+        print(line)
+
+
+def report(result):
+    for step in result['setup']:
+        if step['status'] >= 500 or step['status'] == 0:
+            print(f'Ошибка {step["status"]}: {step["name"]} '
+                  f'({step["endpoint"]})')
+    print(f'\nРевизия {result["revision"]}, {result["workers"]} '
+          f'{result["executor"]}, {result["iterations"]} повторов:')
+    for endpoint, stats in result['endpoints'].items():
+        print(f'  {endpoint:<58} p50 {stats["p50"]:7.2f}  '
+              f'p95 {stats["p95"]:7.2f}  p99 {stats["p99"]:7.2f} мс  '
+              f'{stats["rps"]:8.1f} зап/с  SQL {stats["queries"]}')
+
+
+def prepare_database(recipes):
+    from django.core.management import call_command
+
+    call_command('load_data', str(BASE_DIR / 'data' / 'ingredients.csv'),
+                 verbosity=0, stdout=open(os.devnull, 'w'))
+    if recipes:
+        call_command('seed_data', users=max(10, recipes // 10),
+                     recipes=recipes, stdout=open(os.devnull, 'w'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--executor', choices=('thread', 'process'),
+                        default='thread')
+    parser.add_argument('--recipes', type=int, default=0,
+                        help='Сгенерировать столько рецептов seed_data.')
+    parser.add_argument('--base-url',
+                        help='Адрес запущенного сервера вместо клиента.')
+    parser.add_argument('--collection', type=Path, default=COLLECTION_PATH)
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--compare', type=Path)
+    args = parser.parse_args()
+
+    variables, steps = load_steps(args.collection)
+    # Ответы 4xx и 5xx ожидаемы в коллекции, коды попадают в отчёт.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    with ExitStack() as stack:
+        db_name = None
+        if not args.base_url:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+            if args.executor == 'process':
+                # Процессам пула нужна общая база, а не SQLite в памяти.
+                db_name = os.path.join(workdir, 'benchmark.sqlite3')
+            stack.enter_context(django_test_db(test_name=db_name))
+            from django.db import connection
+            from django.test.utils import override_settings
+
+            db_name = connection.settings_dict['NAME']
+            stack.enter_context(override_settings(
+                MEDIA_ROOT=workdir,
+                INGREDIENT_CATALOG_DIR=os.path.join(workdir, 'catalog'),
+            ))
+            prepare_database(args.recipes)
+            client = InProcessClient()
+        else:
+            client = HttpClient(args.base_url)
+
+        setup = run_setup(client, variables, steps)
+        if args.executor == 'process':
+            executor = ProcessPoolExecutor(
+                args.workers, mp_context=multiprocessing.get_context('fork'),
+                initializer=init_worker, initargs=(args.base_url, db_name)
+            )
+        else:
+            executor = ThreadPoolExecutor(args.workers)
+        with executor:
+            endpoints = run_endpoints(executor, args.base_url, variables,
+                                      steps, args.iterations)
+        endpoints.update(run_flows(client, variables, steps,
+                                   args.iterations))
+
+    result = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'target': args.base_url or 'test-client',
+        'executor': args.executor,
+        'workers': args.workers,
+        'iterations': args.iterations,
+        'recipes': args.recipes,
+        'setup': setup,
+        'endpoints': endpoints,
+    }
+    report(result)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(json.load(file), result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Накладные расходы на соединение с базой на запрос.
+
+Запуск из каталога backend::
+
+    python -m benchmarks.db_connections [--requests 500] [--threads 1]
+        [--settings backend.settings_production] [--max-age 60]
+
+Каждый «запрос» повторяет цикл обработки Django без HTTP: сигнал
+request_started, небольшой запрос к справочнику ингредиентов и сигнал
+request_finished, на котором Django закрывает устаревшие соединения.
+Режимы:
+
+* per-request — CONN_MAX_AGE=0, новое соединение на каждый запрос
+  (прежние настройки);
+* persistent — CONN_MAX_AGE=--max-age и CONN_HEALTH_CHECKS, соединение
+  потока переиспользуется;
+* pool — пул psycopg, если он включён в настройках (DB_POOL=true); вместо
+  persistent, потому что Django не совмещает пул с постоянными
+  соединениями.
+
+Для SQLite временная база создаётся в файле, чтобы соединения
+действительно закрывались и открывались с PRAGMA из настроек.
+"""
+import argparse
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from benchmarks import django_test_db, summary, timed
+
+
+def request_cycle():
+    from django.core.signals import request_finished, request_started
+
+    from core.models import Ingredient
+
+    request_started.send(sender=None)
+    try:
+        list(Ingredient.objects.order_by('name')[:10])
+    finally:
+        request_finished.send(sender=None)
+
+
+def configure(mode, max_age, pool):
+    """Настраивает соединение default для режима.
+
+    Словарь настроек общий для соединений всех потоков.
+    """
+    from django.db import connection
+
+    connection.close()
+    options = connection.settings_dict['OPTIONS']
+    if mode == 'per-request':
+        options.pop('pool', None)
+        connection.settings_dict['CONN_MAX_AGE'] = 0
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = False
+    elif mode == 'persistent':
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+    else:
+        options['pool'] = pool
+
+
+def run(mode, requests, threads, max_age, pool=None):
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+
+    opened = []
+    lock = threading.Lock()
+
+    def count_connection(sender, **kwargs):
+        with lock:
+            opened.append(1)
+
+    def worker(count):
+        try:
+            return timed(request_cycle, repeat=count)
+        finally:
+            connection.close()
+
+    configure(mode, max_age, pool)
+    connection_created.connect(count_connection)
+    try:
+        shares = [requests // threads + (idx < requests % threads)
+                  for idx in range(threads)]
+        with ThreadPoolExecutor(threads) as executor:
+            timings = [timing for chunk in executor.map(worker, shares)
+                       for timing in chunk]
+    finally:
+        connection_created.disconnect(count_connection)
+    stats = summary(timings)
+    print(f'  {mode:<12} среднее {stats["mean"]:8.3f} мс  '
+          f'p50 {stats["p50"]:8.3f} мс  p95 {stats["p95"]:8.3f} мс  '
+          f'соединений {len(opened)}')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--max-age', type=int, default=60)
+    parser.add_argument('--settings', default='backend.settings')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', args.settings)
+    import django
+    django.setup()
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    pool = database.get('OPTIONS', {}).get('pool')
+    with ExitStack() as stack:
+        test_name = None
+        if database['ENGINE'].endswith('sqlite3'):
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            test_name = os.path.join(directory, 'benchmark.sqlite3')
+        connection = stack.enter_context(
+            django_test_db(args.settings, test_name=test_name)
+        )
+        from core.models import Ingredient
+
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {idx}', measurement_unit='г')
+            for idx in range(100)
+        )
+        print(f'\n{connection.vendor}: {args.requests} запросов, '
+              f'{args.threads} потоков')
+        baseline = run('per-request', args.requests, args.threads,
+                       args.max_age)
+        reused = run('pool' if pool else 'persistent', args.requests,
+                     args.threads, args.max_age, pool)
+        print(f'  Ускорение p50: {baseline["p50"] / reused["p50"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Сравнение поиска ингредиентов через ORM и через индекс в памяти.
+
+Запуск из каталога backend::
+
+    python -m benchmarks.ingredient_search [--synthetic 200000]
+
+Каталоги: настоящий data/ingredients.csv и синтетический, собранный из
+его слов. Для каждого каталога измеряется прежний путь
+(name__icontains без ограничения) и IngredientSearchIndex.search().
+"""
+import argparse
+import csv
+import random
+from pathlib import Path
+
+from benchmarks import django_test_db, summary, timed
+
+CSV_PATH = Path(__file__).resolve().parent.parent / 'data' / 'ingredients.csv'
+
+
+def read_catalog():
+    with open(CSV_PATH, encoding='utf-8') as file:
+        return [(name, unit) for name, unit in csv.reader(file)]
+
+
+def synthetic_catalog(base, size, rng):
+    words = sorted({word for name, _ in base for word in name.split()})
+    units = sorted({unit for _, unit in base})
+    return [
+        (' '.join(rng.sample(words, rng.randint(1, 3))) + f' {idx}',
+         rng.choice(units))
+        for idx in range(size)
+    ]
+
+
+def queries_for(catalog, rng, count):
+    names = [name for name, _ in catalog]
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        length = rng.randint(1, min(6, len(name)))
+        start = rng.choice((0, 0, rng.randint(0, len(name) - length)))
+        queries.append(name[start:start + length])
+    return queries
+
+
+def run(catalog, label, rng, query_count, limit):
+    from api.search import IngredientSearchIndex
+    from core.models import Ingredient
+
+    Ingredient.objects.all().delete()
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit)
+         for name, unit in catalog),
+        batch_size=5000
+    )
+    queries = queries_for(catalog, rng, query_count)
+
+    def orm_search(query):
+        return list(Ingredient.objects.filter(
+            name__icontains=query
+        ).order_by('name').values('id', 'name', 'measurement_unit'))
+
+    build = timed(IngredientSearchIndex.from_db)[0]
+    index = IngredientSearchIndex.from_db()
+    orm = [timed(orm_search, query)[0] for query in queries]
+    memory = [timed(index.search, query, limit)[0] for query in queries]
+
+    print(f'\n{label}: {len(catalog)} ингредиентов, {len(queries)} запросов,'
+          f' построение индекса {build:.1f} мс')
+    for name, timings in (('ORM icontains', orm), ('Индекс', memory)):
+        stats = summary(timings)
+        print(f'  {name:<14} среднее {stats["mean"]:8.3f} мс  '
+              f'p50 {stats["p50"]:8.3f} мс  p95 {stats["p95"]:8.3f} мс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--synthetic', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with django_test_db():
+        rng = random.Random(args.seed)
+        base = read_catalog()
+        run(base, 'data/ingredients.csv', rng, args.queries, args.limit)
+        if args.synthetic:
+            run(synthetic_catalog(base, args.synthetic, rng), 'Синтетический',
+                rng, args.queries, args.limit)
+
+
+if __name__ == '__main__':
+    main()
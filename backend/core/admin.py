@@ -39,18 +39,6 @@ class UserAdmin(BaseUserAdmin):
             'height="50" style="border-radius: 50%;" />'
         )
 
-    @admin.display(description="Рецептов")
-    def recipes_count(self, user):
-        return user.recipes.count()
-
-    @admin.display(description="Кол-во подписок")
-    def subscriptions_count(self, user):
-        return user.followers.count()
-
-    @admin.display(description="Кол-во подписчиков")
-    def subscribers_count(self, user):
-        return user.authors.count()
-
 
 # Инлайн-редактирование ингредиентов в рецепте
 class RecipeIngredientInline(admin.TabularInline):
@@ -71,10 +59,10 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'cooking_time', 'date_published')
     search_fields = ('name', 'author__username')
     inlines = [RecipeIngredientInline]
+    list_select_related = ('author',)
 
-    @admin.display(description="В избранное")
-    def favorites_count(self, recipe):
-        return recipe.favorites.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('ingredients')
 
     @admin.display(description="Продукты")
     @mark_safe
@@ -101,15 +89,12 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'measurement_unit')
     list_filter = ('measurement_unit',)
 
-    @admin.display(description="Рецептов")
-    def recipes_count(self, ingredient):
-        return ingredient.recipes.count()
-
 
 # Кастомная админка для моделей Favorite и ShoppingCart
 @admin.register(Favorite, ShoppingCart)
 class FavoriteAndShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
     list_filter = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
 
@@ -118,5 +103,6 @@ class FavoriteAndShoppingCartAdmin(admin.ModelAdmin):
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
     list_filter = ('user', 'author')
     search_fields = ('user__username', 'author__username')
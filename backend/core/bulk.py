@@ -0,0 +1,100 @@
+"""Массовая вставка строк, заданных кортежами значений.
+
+bulk_create создаёт экземпляр модели на каждую строку, не сообщает, сколько
+строк на самом деле добавлено при ignore_conflicts=True, и на PostgreSQL
+передаёт все значения параметрами одного запроса. Функции модуля
+принимают кортежи значений полей и возвращают точное число вставленных
+строк. На PostgreSQL пакет загружается через COPY (при пропуске
+конфликтов — во временную таблицу с переносом одним INSERT ... SELECT ...
+ON CONFLICT DO NOTHING), в остальных СУБД — через executemany.
+"""
+import io
+
+from django.db import connections, router, transaction
+from django.db.models.constants import OnConflict
+
+
+def insert_rows(model, fields, rows, using=None, ignore_conflicts=False):
+    """Вставляет кортежи значений полей fields; возвращает число новых строк.
+
+    При ignore_conflicts строки, конфликтующие с уже существующими (или
+    друг с другом), молча пропускаются.
+    """
+    if not rows:
+        return 0
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    opts = model._meta
+    model_fields = [opts.get_field(field) for field in fields]
+    rows = [
+        [field.get_db_prep_save(value, connection)
+         for field, value in zip(model_fields, row)]
+        for row in rows
+    ]
+    table = connection.ops.quote_name(opts.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in model_fields
+    )
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if ignore_conflicts:
+                return copy_insert_ignore(cursor, table, columns, rows)
+            copy_rows(cursor, table, columns, rows)
+            return len(rows)
+        on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+        insert = connection.ops.insert_statement(on_conflict=on_conflict)
+        suffix = connection.ops.on_conflict_suffix_sql(
+            model_fields, on_conflict, None, None
+        )
+        placeholders = ', '.join(['%s'] * len(fields))
+        cursor.executemany(
+            f'{insert} {table} ({columns}) VALUES ({placeholders}) {suffix}',
+            rows
+        )
+        return cursor.rowcount
+
+
+def insert_ignore(model, fields, rows, using=None):
+    """insert_rows с пропуском строк, нарушающих уникальность."""
+    return insert_rows(model, fields, list(rows), using,
+                       ignore_conflicts=True)
+
+
+def copy_value(value):
+    if value is None:
+        return r'\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Загружает строки в таблицу командой COPY ... FROM STDIN."""
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    data = ''.join(
+        '\t'.join(copy_value(value) for value in row) + '\n' for row in rows
+    )
+    copy_sql = f'COPY {table} ({columns}) FROM STDIN'
+    if is_psycopg3:
+        with cursor.copy(copy_sql) as copy:
+            copy.write(data)
+    else:
+        cursor.copy_expert(copy_sql, io.StringIO(data))
+
+
+def copy_insert_ignore(cursor, table, columns, rows):
+    """COPY пакета во временную таблицу и перенос его в основную."""
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE bulk_insert_rows ON COMMIT DROP AS '
+        f'SELECT {columns} FROM {table} WITH NO DATA'
+    )
+    copy_rows(cursor, 'bulk_insert_rows', columns, rows)
+    cursor.execute(
+        f'INSERT INTO {table} ({columns}) '
+        f'SELECT {columns} FROM bulk_insert_rows ON CONFLICT DO NOTHING'
+    )
+    inserted = cursor.rowcount
+    cursor.execute('DROP TABLE bulk_insert_rows')
+    return inserted
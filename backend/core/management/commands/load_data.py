@@ -1,37 +1,183 @@
+import csv
 import json
-import os
+import re
+import time
+from itertools import islice
+from pathlib import Path
+
 from django.core.management.base import BaseCommand
+from api.catalog import build_snapshot
+from api.search import invalidate_index
+from core.bulk import insert_ignore
 from core.models import Ingredient
 
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson',
+           '.jsonl': 'ndjson'}
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json_array(file, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива, читаемого из файла частями."""
+    decoder = json.JSONDecoder()
+    buffer, pos, state = '', 0, 'start'
+
+    def read_more():
+        nonlocal buffer, pos
+        chunk = file.read(chunk_size)
+        buffer, pos = buffer[pos:] + chunk, 0
+        return chunk
+
+    while True:
+        pos = WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if not read_more():
+                raise ValueError('Неожиданный конец JSON-массива')
+            continue
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError('Ожидается JSON-массив')
+            pos, state = pos + 1, 'first'
+        elif char == ']' and state in ('first', 'next'):
+            return
+        elif state == 'next':
+            if char != ',':
+                raise ValueError(f'Ожидается «,» вместо «{char}»')
+            pos, state = pos + 1, 'item'
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                end = None
+            # Элемент может быть обрезан границей блока.
+            if end is None or end == len(buffer):
+                if read_more():
+                    continue
+                if end is None:
+                    decoder.raw_decode(buffer, pos)
+            yield item
+            pos, state = end, 'next'
+
+
+def detect_format(path, file):
+    file_format = FORMATS.get(path.suffix.lower())
+    if file_format == 'json':
+        # .json может содержать как массив, так и объекты по строкам.
+        start = file.read(CHUNK_SIZE).lstrip()[:1]
+        file.seek(0)
+        return 'json' if start == '[' else 'ndjson'
+    return file_format
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
-    help = "Загружает ингредиенты из JSON-фикстуры"
+    help = (
+        "Загружает ингредиенты из CSV, JSON или NDJSON пакетами, "
+        "пропуская уже существующие"
+    )
 
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join("data", "ingredients.json")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='data/ingredients.json',
+            help='Файл с ингредиентами (по умолчанию data/ingredients.json).'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json', 'ndjson'),
+            help='Формат файла; по умолчанию определяется по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def clean(self, item):
+        """Пара (название, единица) или None для некорректной записи."""
+        if isinstance(item, dict):
+            item = item.get('name'), item.get('measurement_unit')
+        if not isinstance(item, (list, tuple)) or len(item) < 2:
+            return None
+        name, unit = item[:2]
+        if not isinstance(name, str) or not isinstance(unit, str):
+            return None
+        name, unit = name.strip(), unit.strip()
+        if not name or not unit or len(name) > self.name_length \
+                or len(unit) > self.unit_length:
+            return None
+        return name, unit
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        self.name_length = Ingredient._meta.get_field('name').max_length
+        self.unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        total = inserted = invalid = 0
+        started = time.perf_counter()
 
         try:
-            with open(file_path, encoding="utf-8") as file:
-                created_count = sum(
-                    1 for _ in Ingredient.objects.bulk_create(
-                        (Ingredient(**row) for row in json.load(file)),
-                        ignore_conflicts=True
+            with open(path, encoding='utf-8', newline='') as file:
+                file_format = options['format'] or detect_format(path, file)
+                if file_format is None:
+                    self.stderr.write(self.style.ERROR(
+                        f"Не удалось определить формат файла {path}, "
+                        "укажите --format"
+                    ))
+                    return
+                reader = {
+                    'csv': read_csv, 'json': read_json_array,
+                    'ndjson': read_ndjson,
+                }[file_format](file)
+                for batch in batched(reader, options['batch_size']):
+                    rows = [self.clean(item) for item in batch]
+                    valid = [row for row in rows if row is not None]
+                    total += len(batch)
+                    invalid += len(batch) - len(valid)
+                    inserted += insert_ignore(
+                        Ingredient, ('name', 'measurement_unit'), valid
                     )
-                )
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            f"Обработано {total} строк, добавлено {inserted}."
+                        )
         except FileNotFoundError:
-            self.stderr.write(self.style.ERROR(f"Файл {file_path} не найден!"))
+            self.stderr.write(self.style.ERROR(f"Файл {path} не найден!"))
             return
-        except json.JSONDecodeError:
+        except (ValueError, csv.Error) as e:
             self.stderr.write(self.style.ERROR(
-                f"Ошибка чтения JSON в файле {file_path}"
+                f"Ошибка чтения файла {path} после {total} строк: {e}"
             ))
             return
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"Ошибка: {e}"))
             return
+        finally:
+            # Вставка идёт в обход сигналов, поэтому индекс поиска и снимок
+            # справочника обновляются явно, в том числе для пакетов,
+            # загруженных до ошибки.
+            if inserted:
+                invalidate_index()
+                build_snapshot()
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"Данные загружены успешно! Добавлено {created_count} записей."
-            )
-        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Данные загружены успешно! Обработано {total} строк за "
+            f"{elapsed:.2f} с ({total / elapsed if elapsed else 0:.0f} "
+            f"строк/с): добавлено {inserted}, пропущено "
+            f"{total - inserted - invalid} существующих, некорректных "
+            f"{invalid}."
+        ))
@@ -0,0 +1,126 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import ShoppingCart, ShoppingListItem, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает сводку списков покупок по корзинам пользователей "
+        "и сообщает о расхождениях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить расхождения, не перестраивая таблицу.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Пользователей в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        shown = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(User.objects.filter(
+                    pk__gt=last_pk
+                ).order_by('pk').values_list(
+                    'pk', flat=True
+                )[:options['batch_size']])
+                if not user_ids:
+                    break
+                last_pk = user_ids[-1]
+                missing, extra, changed = self.rebuild_batch(
+                    user_ids, options['dry_run']
+                )
+            totals.update(missing=len(missing), extra=len(extra),
+                          changed=len(changed))
+            for key, actual, expected in changed[:20 - shown]:
+                self.stdout.write(
+                    f"Пользователь {key[0]}, ингредиент {key[1]}: "
+                    f"{actual} вместо {expected}"
+                )
+            shown = min(20, shown + len(changed))
+
+        self.stdout.write(
+            f"Отсутствует записей: {totals['missing']}, "
+            f"лишних: {totals['extra']}, "
+            f"с неверными значениями: {totals['changed']}."
+        )
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Сводка перестроена: исправлено "
+            f"{totals['missing'] + totals['extra'] + totals['changed']} "
+            f"записей."
+        ))
+
+    @staticmethod
+    def rebuild_batch(user_ids, dry_run):
+        """Сверяет и исправляет сводку пользователей user_ids.
+
+        Строки корзин и сводки пользователей блокируются в том же порядке,
+        в каком их меняют добавление и удаление рецептов, поэтому
+        параллельное изменение корзины либо дожидается пересчёта и
+        применяется поверх него, либо попадает в него целиком. Строки
+        исправляются на месте: удаление и повторная вставка потеряли бы
+        изменения, ожидающие блокировки удаляемых строк.
+        """
+        if not dry_run:
+            list(ShoppingCart.objects.select_for_update().filter(
+                user_id__in=user_ids
+            ).values_list('pk', flat=True))
+            list(ShoppingListItem.objects.select_for_update().filter(
+                user_id__in=user_ids
+            ).values_list('pk', flat=True))
+        expected = {
+            (item['user_id'], item['ingredient_id']): (
+                item['total_amount'], item['recipe_count']
+            )
+            for item in ShoppingListItem.objects.expected().filter(
+                user_id__in=user_ids
+            )
+        }
+        actual = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=user_ids
+            ).only('user_id', 'ingredient_id', 'total_amount',
+                   'recipe_count')
+        }
+        missing = expected.keys() - actual.keys()
+        extra = [
+            item.pk for key, item in actual.items() if key not in expected
+        ]
+        changed = sorted(
+            (key, (item.total_amount, item.recipe_count), expected[key])
+            for key, item in actual.items()
+            if key in expected
+            and (item.total_amount, item.recipe_count) != expected[key]
+        )
+        if dry_run:
+            return missing, extra, changed
+
+        ShoppingListItem.objects.filter(pk__in=extra).delete()
+        updated = []
+        for key, _, (total_amount, recipe_count) in changed:
+            item = actual[key]
+            item.total_amount, item.recipe_count = total_amount, recipe_count
+            updated.append(item)
+        ShoppingListItem.objects.bulk_update(
+            updated, ['total_amount', 'recipe_count']
+        )
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=expected[user_id, ingredient_id][0],
+                recipe_count=expected[user_id, ingredient_id][1]
+            )
+            for user_id, ingredient_id in missing
+        )
+        return missing, extra, changed
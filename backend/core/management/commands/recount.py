@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from core.models import recount_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики рецептов, подписок, подписчиков и "
+        "избранного по связям и сообщает о расхождениях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить расхождения, не исправляя счётчики.'
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            drift = recount_counters(
+                using=options['database'], dry_run=options['dry_run']
+            )
+        for (model, counter), count in drift.items():
+            self.stdout.write(f"{model}.{counter}: неверных значений {count}")
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Счётчики пересчитаны: исправлено {sum(drift.values())}."
+        ))
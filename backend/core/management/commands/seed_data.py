@@ -0,0 +1,273 @@
+import base64
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from core.bulk import insert_rows
+from core.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, Subscription, User, recount_counters
+)
+
+# Прозрачный PNG 1x1: все рецепты ссылаются на один файл-заглушку.
+PLACEHOLDER_IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg=='
+)
+PLACEHOLDER_NAME = 'recipes/images/seed_placeholder.png'
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DISHES = ('суп', 'салат', 'пирог', 'рагу', 'омлет', 'плов', 'каша',
+          'запеканка', 'паста', 'жаркое')
+STYLES = ('по-домашнему', 'по-летнему', 'по-деревенски', 'по-итальянски',
+          'по-грузински', 'по-французски', 'по-восточному', 'по-купечески')
+
+
+class ZipfSampler:
+    """Выбор различных позиций 0..size-1 с вероятностью ~ 1 / rank^s."""
+
+    def __init__(self, rng, size, exponent):
+        self.rng = rng
+        self.population = range(size)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, size + 1)
+        ))
+
+    def sample(self, count, exclude=None):
+        count = min(count, len(self.population) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(
+                position for position in self.rng.choices(
+                    self.population, cum_weights=self.cum_weights,
+                    k=count - len(chosen)
+                ) if position != exclude
+            )
+        return sorted(chosen)
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует пользователей, рецепты, подписки, избранное и корзины "
+        "для нагрузочного тестирования"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+            help='Диапазон числа ингредиентов в рецепте.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Среднее число рецептов в избранном пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в корзине пользователя.'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password')
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                "Справочник ингредиентов пуст, сначала выполните load_data"
+            )
+        if options['users'] < 1:
+            raise CommandError("Нужен хотя бы один пользователь")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.rng.shuffle(ingredient_ids)
+        self.ingredient_ids = ingredient_ids
+        if not default_storage.exists(PLACEHOLDER_NAME):
+            default_storage.save(
+                PLACEHOLDER_NAME, ContentFile(PLACEHOLDER_IMAGE)
+            )
+
+        with transaction.atomic():
+            self.user_ids = self.next_ids(User, options['users'])
+            self.recipe_ids = self.next_ids(Recipe, options['recipes'])
+            self.stage('Пользователи', self.seed_users)
+            self.stage('Рецепты', self.seed_recipes)
+            self.stage('Подписки', self.seed_subscriptions)
+            self.stage('Избранное', self.seed_links, Favorite,
+                       options['favorites'])
+            self.stage('Корзины', self.seed_links, ShoppingCart,
+                       options['carts'])
+            self.stage('Списки покупок', self.seed_shopping_lists)
+            self.stage('Счётчики', self.seed_counters)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Recipe]
+                ):
+                    cursor.execute(sql)
+
+        self.stdout.write(self.style.SUCCESS("Данные сгенерированы."))
+
+    def stage(self, title, method, *args):
+        started = time.perf_counter()
+        count = method(*args)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{title}: {count} строк за {elapsed:.2f} с "
+            f"({count / elapsed if elapsed else 0:.0f} строк/с)"
+        )
+
+    @staticmethod
+    def next_ids(model, count):
+        start = (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        return range(start, start + count)
+
+    def write(self, model, fields, rows):
+        """Записывает строки пакетами, возвращает их число."""
+        count, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.options['batch_size']:
+                count += insert_rows(model, fields, batch)
+                batch = []
+        return count + insert_rows(model, fields, batch)
+
+    def spread(self, average):
+        """Случайное число со средним average."""
+        return self.rng.randint(0, 2 * average) if average > 0 else 0
+
+    def seed_users(self):
+        password = make_password(self.options['password'])
+        prefix = f"seed{self.options['seed']}_{self.user_ids.start}"
+        return self.write(
+            User,
+            ('id', 'password', 'is_superuser', 'is_staff', 'is_active',
+             'date_joined', 'username', 'email', 'first_name', 'last_name',
+             'avatar'),
+            (
+                (user_id, password, False, False, True, EPOCH,
+                 f'{prefix}_{idx}', f'{prefix}_{idx}@example.com',
+                 'Имя', f'Фамилия {idx}', User.avatar.field.default)
+                for idx, user_id in enumerate(self.user_ids)
+            )
+        )
+
+    def seed_recipes(self):
+        rng = self.rng
+        authors = ZipfSampler(rng, len(self.user_ids), self.options['zipf'])
+        ingredients = ZipfSampler(
+            rng, len(self.ingredient_ids), self.options['zipf']
+        )
+        low, high = self.options['ingredients']
+        recipe_rows, ingredient_rows = [], []
+        count = 0
+
+        def flush():
+            nonlocal count
+            count += insert_rows(
+                Recipe,
+                ('id', 'name', 'text', 'image', 'cooking_time',
+                 'date_published', 'author'),
+                recipe_rows
+            )
+            count += insert_rows(
+                RecipeIngredient, ('recipe', 'ingredient', 'amount'),
+                ingredient_rows
+            )
+            recipe_rows.clear()
+            ingredient_rows.clear()
+
+        for recipe_id in self.recipe_ids:
+            author = self.user_ids[authors.sample(1)[0]]
+            recipe_rows.append((
+                recipe_id,
+                f'{rng.choice(DISHES).capitalize()} {rng.choice(STYLES)} '
+                f'№{recipe_id}',
+                'Смешать ингредиенты и довести до готовности.',
+                PLACEHOLDER_NAME, rng.randint(5, 180),
+                EPOCH + timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                author,
+            ))
+            ingredient_rows.extend(
+                (recipe_id, self.ingredient_ids[position],
+                 rng.randint(1, 500))
+                for position in ingredients.sample(rng.randint(low, high))
+            )
+            if len(recipe_rows) == self.options['batch_size']:
+                flush()
+        flush()
+        return count
+
+    def seed_subscriptions(self):
+        authors = ZipfSampler(
+            self.rng, len(self.user_ids), self.options['zipf']
+        )
+        return self.write(
+            Subscription, ('user', 'author'),
+            (
+                (user_id, self.user_ids[position])
+                for idx, user_id in enumerate(self.user_ids)
+                for position in authors.sample(
+                    self.spread(self.options['subscriptions']), exclude=idx
+                )
+            )
+        )
+
+    def seed_links(self, model, average):
+        if not self.recipe_ids:
+            return 0
+        recipes = ZipfSampler(
+            self.rng, len(self.recipe_ids), self.options['zipf']
+        )
+        # Популярные рецепты разбросаны по всей ленте, а не только в начале.
+        ranked = list(self.recipe_ids)
+        self.rng.shuffle(ranked)
+        return self.write(
+            model, ('user', 'recipe'),
+            (
+                (user_id, ranked[position])
+                for user_id in self.user_ids
+                for position in recipes.sample(self.spread(average))
+            )
+        )
+
+    def seed_counters(self):
+        # Строки вставлялись напрямую, без учёта в счётчиках.
+        return sum(recount_counters().values())
+
+    def seed_shopping_lists(self):
+        count = 0
+        batch_size = max(1, self.options['batch_size'] // 100)
+        for start in range(0, len(self.user_ids), batch_size):
+            user_ids = self.user_ids[start:start + batch_size]
+            count += insert_rows(
+                ShoppingListItem,
+                ('user', 'ingredient', 'total_amount', 'recipe_count'),
+                list(ShoppingListItem.objects.expected().filter(
+                    user_id__range=(
+                        user_ids.start, user_ids.stop - 1
+                    )
+                ).values_list(
+                    'user_id', 'ingredient_id', 'total_amount',
+                    'recipe_count'
+                ))
+            )
+        return count
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_favorite_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-date_published', '-id'], name='recipe_date_published_id_idx'),
+        ),
+    ]
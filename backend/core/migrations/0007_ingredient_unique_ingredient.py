@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:49
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает дубликаты ингредиентов перед добавлением ограничения.
+
+    Ссылки рецептов переводятся на ингредиент с наименьшим id (при
+    совпадении рецепта количества складываются), сводка списков покупок
+    по объединённому ингредиенту пересчитывается.
+    """
+    Ingredient = apps.get_model('core', 'Ingredient')
+    RecipeIngredient = apps.get_model('core', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('core', 'ShoppingListItem')
+
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        count=Count('id'), keep_id=Min('id')
+    ).filter(count__gt=1).order_by()
+    for group in groups:
+        keep_id = group['keep_id']
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id).values_list('id', flat=True))
+
+        for item in RecipeIngredient.objects.filter(
+            ingredient_id__in=duplicate_ids
+        ):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=item.recipe_id, ingredient_id=keep_id
+            ).first()
+            if kept is None:
+                item.ingredient_id = keep_id
+                item.save(update_fields=['ingredient'])
+            else:
+                kept.amount += item.amount
+                kept.save(update_fields=['amount'])
+                item.delete()
+
+        ShoppingListItem.objects.filter(
+            ingredient_id__in=[keep_id, *duplicate_ids]
+        ).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(ingredient_id=keep_id, **item)
+            for item in RecipeIngredient.objects.filter(
+                ingredient_id=keep_id, recipe__shopping_carts__isnull=False
+            ).values(
+                user_id=F('recipe__shopping_carts__user_id')
+            ).annotate(
+                total_amount=Sum('amount'), recipe_count=Count('recipe_id')
+            ).order_by()
+        )
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'author', 'User', 'recipes_count'),
+    ('Subscription', 'user', 'User', 'subscriptions_count'),
+    ('Subscription', 'author', 'User', 'subscribers_count'),
+    ('Favorite', 'recipe', 'Recipe', 'favorites_count'),
+    ('RecipeIngredient', 'ingredient', 'Ingredient', 'recipes_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет новые счётчики числом существующих связей."""
+    for link_name, field, target_name, counter in COUNTERS:
+        link = apps.get_model('core', link_name)
+        target = apps.get_model('core', target_name)
+        target.objects.update(**{counter: Coalesce(Subquery(
+            link.objects.filter(**{field: OuterRef('pk')}).order_by(
+            ).values(field).annotate(count=Count('pk')).values('count')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_ingredient_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='В избранное'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Кол-во подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscriptions_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Кол-во подписок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,21 +1,136 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, connections, models, router
+from django.db.models.constants import OnConflict
+from django.db.models import (
+    Case, Count, F, OuterRef, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
 from django.utils.timezone import now
 
 
+# Денормализованные счётчики: модель связи → пары (поле связи, счётчик
+# объекта, на который оно ссылается). Счётчики увеличиваются при
+# создании связи (save и bulk_create) и уменьшаются при её удалении
+# (сигналы core.signals), команда recount исправляет расхождения.
+COUNTERS = {
+    'Recipe': (('author', 'recipes_count'),),
+    'Subscription': (
+        ('user', 'subscriptions_count'), ('author', 'subscribers_count'),
+    ),
+    'Favorite': (('recipe', 'favorites_count'),),
+    'RecipeIngredient': (('ingredient', 'recipes_count'),),
+}
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся полем field на объект.
+
+    В отличие от нескольких Count по разным связям, подзапросы не
+    перемножают строки соединений.
+    """
+    return Coalesce(Subquery(
+        model._base_manager.filter(**{field: OuterRef('pk')}).order_by(
+        ).values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def change_counters(model, objects, sign, using=None, origin=None):
+    """Прибавляет sign к счётчикам объектов, на которые ссылаются objects.
+
+    Значения меняются выражением F() без чтения, одним UPDATE на каждую
+    величину изменения. Объект origin, удаление которого каскадом удалило
+    связи, пропускается.
+    """
+    for field_name, counter in COUNTERS.get(model._meta.object_name, ()):
+        field = model._meta.get_field(field_name)
+        deltas = Counter(getattr(obj, field.attname) for obj in objects)
+        if isinstance(origin, field.related_model):
+            deltas.pop(origin.pk, None)
+        groups = defaultdict(list)
+        for pk, count in deltas.items():
+            groups[count].append(pk)
+        manager = field.related_model._base_manager.db_manager(using)
+        for count, pks in groups.items():
+            manager.filter(pk__in=pks).update(
+                **{counter: F(counter) + sign * count}
+            )
+
+
+def recount_counters(using=DEFAULT_DB_ALIAS, dry_run=False,
+                     apps=global_apps):
+    """Сверяет счётчики с числом связей и исправляет расхождения.
+
+    Возвращает словарь {(модель, счётчик): число неверных строк}.
+    """
+    drift = {}
+    for name, counters in COUNTERS.items():
+        model = apps.get_model('core', name)
+        for field_name, counter in counters:
+            target = model._meta.get_field(field_name).related_model
+            actual = count_of(model, field_name)
+            wrong = target._base_manager.using(using).annotate(
+                actual=actual
+            ).exclude(**{counter: F('actual')})
+            drift[target._meta.object_name, counter] = (
+                wrong.count() if dry_run
+                else wrong.update(**{counter: actual})
+            )
+    return drift
+
+
+class CountedQuerySet(models.QuerySet):
+    """Учитывает bulk_create в счётчиках COUNTERS.
+
+    ignore_conflicts и update_conflicts не поддерживаются: bulk_create не
+    сообщает, какие строки пропущены, и счётчики учли бы их как новые.
+    Связи без повторов создаёт UserLinkManager.link_many.
+    """
+
+    def bulk_create(self, objs, *args, ignore_conflicts=False,
+                    update_conflicts=False, **kwargs):
+        if ignore_conflicts or update_conflicts:
+            raise ValueError(
+                f'bulk_create с обработкой конфликтов не поддерживается '
+                f'для {self.model._meta.object_name}: счётчики учли бы '
+                f'пропущенные строки.'
+            )
+        objs = super().bulk_create(objs, *args, **kwargs)
+        change_counters(self.model, objs, 1, self.db)
+        return objs
+
+
+CountedManager = models.Manager.from_queryset(CountedQuerySet)
+
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=128, verbose_name='Название')
     measurement_unit = models.CharField(
         max_length=64,
         verbose_name='Ед. изм.',
     )
+    recipes_count = models.IntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        db_default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -48,6 +163,24 @@ class User(AbstractUser):
         blank=True,
         default='users/default_avatar.png'
     )
+    recipes_count = models.IntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        db_default=0,
+        editable=False,
+    )
+    subscriptions_count = models.IntegerField(
+        verbose_name='Кол-во подписок',
+        default=0,
+        db_default=0,
+        editable=False,
+    )
+    subscribers_count = models.IntegerField(
+        verbose_name='Кол-во подписчиков',
+        default=0,
+        db_default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -91,11 +224,25 @@ class Recipe(models.Model):
         default=now,
         verbose_name='Date Published'
     )
+    favorites_count = models.IntegerField(
+        verbose_name='В избранное',
+        default=0,
+        db_default=0,
+        editable=False,
+    )
+
+    objects = CountedManager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-date_published']
+        indexes = [
+            models.Index(
+                fields=['-date_published', '-id'],
+                name='recipe_date_published_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -119,6 +266,8 @@ class RecipeIngredient(models.Model):
         validators=[MinValueValidator(1)],
     )
 
+    objects = CountedManager()
+
     class Meta:
         verbose_name = 'Ингредиенты рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
@@ -133,6 +282,142 @@ class RecipeIngredient(models.Model):
         return f'{self.amount} {self.ingredient.name} в {self.recipe.name}'
 
 
+class UserLinkManager(CountedManager):
+    """Менеджер связей пользователя с объектом (избранное, подписка...)."""
+
+    def __init__(self, target_field):
+        super().__init__()
+        self.target_field = target_field
+
+    def link(self, user, target_id):
+        """Создаёт связь одним INSERT ... SELECT без гонок.
+
+        Возвращает True, если запись создана, и False, если она уже была.
+        Строка вставляется только при существовании целевого объекта, а
+        повтор гасится ON CONFLICT DO NOTHING (INSERT OR IGNORE в SQLite).
+        Если ничего не вставлено и объекта нет, бросается его
+        DoesNotExist; отдельной проверки до вставки не требуется.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(self.link_sql(connection, 1),
+                           [user.pk, target_id])
+            created = cursor.rowcount == 1
+        if created:
+            self.change_counters(user, [target_id], 1, connection.alias)
+            return True
+        target_model = self.model._meta.get_field(
+            self.target_field
+        ).related_model
+        if not target_model._default_manager.using(
+            connection.alias
+        ).filter(pk=target_id).exists():
+            raise target_model.DoesNotExist
+        return False
+
+    def link_many(self, user, target_ids):
+        """Создаёт связи с существующими объектами target_ids.
+
+        Возвращает множество id, для которых запись вставлена этим
+        запросом. Его даёт RETURNING того же INSERT ... SELECT, поэтому
+        параллельные запросы с одинаковыми id не учтут одну связь дважды.
+        Без поддержки RETURNING связи создаются по одной через link().
+        """
+        if not target_ids:
+            return set()
+        connection = connections[router.db_for_write(self.model)]
+        if not connection.features.can_return_rows_from_bulk_insert:
+            linked = set()
+            for target_id in target_ids:
+                try:
+                    if self.link(user, target_id):
+                        linked.add(target_id)
+                except ObjectDoesNotExist:
+                    pass
+            return linked
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.link_sql(connection, len(target_ids), returning=True),
+                [user.pk, *target_ids]
+            )
+            linked = {row[0] for row in cursor.fetchall()}
+        self.change_counters(user, linked, 1, connection.alias)
+        return linked
+
+    def unlink(self, user, target_id):
+        """Удаляет связь одним DELETE, возвращает True при удалении."""
+        return bool(self.unlink_many(user, [target_id]))
+
+    def unlink_many(self, user, target_ids):
+        """Удаляет связи с target_ids и возвращает множество удалённых id.
+
+        Счётчики уменьшаются только для строк, которые удалил этот
+        DELETE (RETURNING или rowcount при удалении по одной), а не для
+        найденных до него: параллельное удаление той же связи не вычтет
+        её дважды. Связи не имеют зависимых объектов, поэтому удаление
+        обходится без сборщика каскадов и сигналов post_delete.
+        """
+        if not target_ids:
+            return set()
+        connection = connections[router.db_for_write(self.model)]
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        target_column = qn(opts.get_field(self.target_field).column)
+        sql = (
+            f'DELETE FROM {qn(opts.db_table)} '
+            f'WHERE {qn(opts.get_field("user").column)} = %s '
+            f'AND {target_column} IN '
+        )
+        with connection.cursor() as cursor:
+            if connection.features.can_return_rows_from_bulk_insert:
+                cursor.execute(
+                    f'{sql}({", ".join(["%s"] * len(target_ids))}) '
+                    f'RETURNING {target_column}',
+                    [user.pk, *target_ids]
+                )
+                unlinked = {row[0] for row in cursor.fetchall()}
+            else:
+                unlinked = set()
+                for target_id in target_ids:
+                    cursor.execute(f'{sql}(%s)', [user.pk, target_id])
+                    if cursor.rowcount:
+                        unlinked.add(target_id)
+        self.change_counters(user, unlinked, -1, connection.alias)
+        return unlinked
+
+    def link_sql(self, connection, count, returning=False):
+        """INSERT ... SELECT связей с существующими объектами из count id.
+
+        Параметры запроса: id пользователя, затем id объектов.
+        """
+        ops = connection.ops
+        qn = ops.quote_name
+        target = self.model._meta.get_field(self.target_field)
+        target_model = target.related_model
+        target_pk = qn(target_model._meta.pk.column)
+        user_column = self.model._meta.get_field('user').column
+        sql = (
+            f'{ops.insert_statement(on_conflict=OnConflict.IGNORE)} '
+            f'{qn(self.model._meta.db_table)} '
+            f'({qn(user_column)}, {qn(target.column)}) '
+            f'SELECT %s, {target_pk} '
+            f'FROM {qn(target_model._meta.db_table)} '
+            f'WHERE {target_pk} IN ({", ".join(["%s"] * count)}) '
+            f'{ops.on_conflict_suffix_sql([], OnConflict.IGNORE, [], [])}'
+        )
+        if returning:
+            sql += f' RETURNING {qn(target.column)}'
+        return sql
+
+    def change_counters(self, user, target_ids, sign, using):
+        """Меняет счётчики на sign для связей user с target_ids."""
+        attname = self.model._meta.get_field(self.target_field).attname
+        change_counters(self.model, [
+            self.model(user_id=user.pk, **{attname: target_id})
+            for target_id in target_ids
+        ], sign, using)
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -147,6 +432,8 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UserLinkManager('recipe')
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
@@ -176,6 +463,8 @@ class Subscription(models.Model):
         verbose_name='Автор',
     )
 
+    objects = UserLinkManager('author')
+
     class Meta:
         verbose_name = 'подписка'
         verbose_name_plural = 'Подписки'
@@ -204,6 +493,8 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UserLinkManager('recipe')
+
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
@@ -216,3 +507,152 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'У {self.user.username} есть в корзине {self.recipe.name}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """Поддержка агрегата списка покупок в актуальном состоянии.
+
+    Методы должны вызываться в той же транзакции, что и изменение
+    корзины или ингредиентов рецепта. Сохранение и удаление отдельных
+    строк ShoppingCart и RecipeIngredient, в том числе каскадом и из
+    админки, учитывают сигналы core.signals; записи в обход сигналов
+    (link, bulk_create, bulk_update) учитываются явно.
+    """
+
+    def apply_changes(self, user_ids, changes):
+        """Применяет изменения к спискам покупок пользователей.
+
+        changes — словарь {ingredient_id: (изменение количества,
+        изменение числа рецептов)}.
+        """
+        user_ids = list(user_ids)
+        changes = {
+            ingredient_id: delta for ingredient_id, delta in changes.items()
+            if any(delta)
+        }
+        if not user_ids or not changes:
+            return
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, (_, recipes) in changes.items()
+                if recipes > 0
+            ),
+            ignore_conflicts=True
+        )
+        items = self.filter(user_id__in=user_ids,
+                            ingredient_id__in=changes)
+        items.update(
+            total_amount=F('total_amount') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(amount))
+                  for ingredient_id, (amount, _) in changes.items()),
+                default=Value(0)
+            ),
+            recipe_count=F('recipe_count') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(recipes))
+                  for ingredient_id, (_, recipes) in changes.items()),
+                default=Value(0)
+            ),
+        )
+        items.filter(recipe_count__lte=0).delete()
+
+    def add_recipes(self, user, recipe_ids, sign=1):
+        """Учитывает ингредиенты рецептов, добавленных в корзину."""
+        self.change_cart(user.pk, recipe_ids, sign)
+
+    def remove_recipes(self, user, recipe_ids):
+        """Вычитает ингредиенты рецептов, удалённых из корзины."""
+        self.add_recipes(user, recipe_ids, sign=-1)
+
+    def change_cart(self, user_id, recipe_ids, sign):
+        """Прибавляет со знаком sign ингредиенты рецептов к списку."""
+        changes = {
+            item['ingredient_id']: (sign * item['amount'],
+                                    sign * item['recipes'])
+            for item in RecipeIngredient.objects.using(self.db).filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id').annotate(
+                amount=Sum('amount'), recipes=Count('id')
+            ).order_by()
+        }
+        self.apply_changes([user_id], changes)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Учитывает правку ингредиентов рецепта во всех корзинах с ним.
+
+        recipe — рецепт или его id, old_amounts и new_amounts — словари
+        {ingredient_id: amount}.
+        """
+        changes = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0),
+                (ingredient_id in new_amounts)
+                - (ingredient_id in old_amounts)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        if not any(any(delta) for delta in changes.values()):
+            return
+        self.apply_changes(
+            ShoppingCart.objects.using(self.db).filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            changes
+        )
+
+    def expected(self):
+        """Агрегат, рассчитанный заново по корзинам и рецептам."""
+        return RecipeIngredient.objects.filter(
+            recipe__shopping_carts__isnull=False
+        ).values(
+            'ingredient_id', user_id=F('recipe__shopping_carts__user_id')
+        ).annotate(
+            total_amount=Sum('amount'), recipe_count=Count('recipe_id')
+        ).order_by()
+
+
+class ShoppingListItem(models.Model):
+    """Сводка ингредиентов корзины пользователя.
+
+    Хранит сумму количества и число рецептов корзины для каждого
+    ингредиента, чтобы выгрузка списка покупок не пересчитывала её.
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        on_delete=models.CASCADE,
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Общее количество',
+        default=0,
+    )
+    recipe_count = models.IntegerField(
+        verbose_name='Рецептов',
+        default=0,
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.total_amount} {self.ingredient.name} '
+                f'для {self.user.username}')
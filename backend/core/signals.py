@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from core.models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem,
+    Subscription, change_counters
+)
+
+
+def link_created(sender, instance, created, raw=False, using=None,
+                 **kwargs):
+    """Новая связь увеличивает счётчики (см. core.models.COUNTERS)."""
+    if created and not raw:
+        change_counters(sender, [instance], 1, using)
+
+
+def link_deleted(sender, instance, using=None, origin=None, **kwargs):
+    """Удалённая связь, в том числе каскадом, уменьшает счётчики."""
+    change_counters(sender, [instance], -1, using, origin)
+
+
+for model in (Recipe, Subscription, Favorite, RecipeIngredient):
+    post_save.connect(link_created, sender=model)
+    post_delete.connect(link_deleted, sender=model)
+
+
+def change_shopping_lists(sender, instance, sign, using):
+    """Прибавляет к спискам покупок строку корзины или ингредиент рецепта.
+
+    Строка сочетается с текущим содержимым базы: корзина — с
+    ингредиентами её рецепта, ингредиент — с корзинами рецепта. Поэтому
+    при каскадном удалении рецепта вместе с корзинами и ингредиентами
+    каждая их пара вычитается ровно один раз, в каком бы порядке ни
+    удалялись таблицы.
+    """
+    items = ShoppingListItem.objects.db_manager(using)
+    if sender is ShoppingCart:
+        items.change_cart(instance.user_id, [instance.recipe_id], sign)
+        return
+    items.apply_changes(
+        ShoppingCart.objects.using(using).filter(
+            recipe_id=instance.recipe_id
+        ).values_list('user_id', flat=True),
+        {instance.ingredient_id: (sign * instance.amount, sign)}
+    )
+
+
+def shopping_list_key(instance):
+    """Поля строки, от которых зависят списки покупок."""
+    return (instance.user_id, instance.recipe_id) if isinstance(
+        instance, ShoppingCart
+    ) else (instance.recipe_id, instance.ingredient_id, instance.amount)
+
+
+def shopping_list_saving(sender, instance, raw=False, using=None,
+                         **kwargs):
+    """Запоминает сохранённую версию строки, которую правят (в админке)."""
+    instance._stored = None if raw or instance._state.adding else (
+        sender._base_manager.using(using).filter(pk=instance.pk).first()
+    )
+
+
+def shopping_list_saved(sender, instance, raw=False, using=None, **kwargs):
+    """Новая или изменённая строка меняет списки покупок."""
+    if raw:
+        return
+    stored = getattr(instance, '_stored', None)
+    if stored is not None:
+        if shopping_list_key(stored) == shopping_list_key(instance):
+            return
+        change_shopping_lists(sender, stored, -1, using)
+    change_shopping_lists(sender, instance, 1, using)
+
+
+def shopping_list_deleted(sender, instance, using=None, **kwargs):
+    """Удалённая строка, в том числе каскадом, вычитается из списков."""
+    change_shopping_lists(sender, instance, -1, using)
+
+
+for model in (ShoppingCart, RecipeIngredient):
+    pre_save.connect(shopping_list_saving, sender=model)
+    post_save.connect(shopping_list_saved, sender=model)
+    post_delete.connect(shopping_list_deleted, sender=model)
@@ -6,7 +6,11 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE',
+        'backend.settings_test' if sys.argv[1:2] == ['test']
+        else 'backend.settings'
+    )
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: